@@ -0,0 +1,10 @@
+"""
+Benchmarks of guide_stat_reports.
+
+These run on synthetic guide star tables (see benchmarks.synthetic), so they do not need
+the mica database. Typical use, from the top of the repository::
+
+    python -m benchmarks.run --out bench-new.json
+    python -m benchmarks.compare bench-old.json bench-new.json
+    python benchmarks/startup.py
+"""
@@ -0,0 +1,100 @@
+"""
+Compare two benchmark reports from benchmarks.run (e.g. of two commits).
+
+For each table size and stage in both reports this prints the wall time and peak
+memory of each, and their ratio (new / base). The exit status is 1 if any stage is
+slower than --threshold times the base.
+"""
+
+import argparse
+import json
+import sys
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base", help="Base benchmark report")
+    parser.add_argument("new", help="New benchmark report")
+    parser.add_argument(
+        "--threshold",
+        default=1.2,
+        type=float,
+        help="Wall time ratio above which a stage counts as a regression",
+    )
+    return parser
+
+
+def get_ratio(new, base):
+    if new is None or base is None or base == 0:
+        return None
+    return new / base
+
+
+def compare(base, new, threshold=1.2):
+    """
+    Compare two benchmark reports.
+
+    :param base: base report dict
+    :param new: new report dict
+    :param threshold: wall time ratio above which a stage counts as a regression
+    :returns: list of dicts (one per size and stage in both reports)
+    """
+    rows = []
+    for size, new_size in new["sizes"].items():
+        if size not in base["sizes"]:
+            continue
+        base_stages = base["sizes"][size]["stages"]
+        for stage, new_stage in new_size["stages"].items():
+            if stage not in base_stages:
+                continue
+            base_stage = base_stages[stage]
+            wall_ratio = get_ratio(new_stage["wall"], base_stage["wall"])
+            rows.append(
+                {
+                    "size": size,
+                    "stage": stage,
+                    "base_wall": base_stage["wall"],
+                    "new_wall": new_stage["wall"],
+                    "wall_ratio": wall_ratio,
+                    "mem_ratio": get_ratio(
+                        new_stage.get("peak_mem"), base_stage.get("peak_mem")
+                    ),
+                    "regression": wall_ratio is not None and wall_ratio > threshold,
+                }
+            )
+    return rows
+
+
+def _format_ratio(ratio):
+    return "     -" if ratio is None else f"{ratio:6.2f}"
+
+
+def main():
+    args = get_parser().parse_args()
+
+    with open(args.base) as fh:
+        base = json.load(fh)
+    with open(args.new) as fh:
+        new = json.load(fh)
+
+    print(f"base: {base['meta']['commit']} ({base['meta']['date']})")
+    print(f"new:  {new['meta']['commit']} ({new['meta']['date']})")
+    print(
+        f"{'size':12s} {'stage':16s} {'base (s)':>9s} {'new (s)':>9s}"
+        f" {'time':>6s} {'memory':>6s}"
+    )
+    rows = compare(base, new, args.threshold)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['size']:12s} {row['stage']:16s}"
+            f" {row['base_wall']:9.3f} {row['new_wall']:9.3f}"
+            f" {_format_ratio(row['wall_ratio'])} {_format_ratio(row['mem_ratio'])}"
+            f"{flag}"
+        )
+
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
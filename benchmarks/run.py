@@ -0,0 +1,293 @@
+"""
+Benchmark the report stages on synthetic guide star tables of several sizes.
+
+Each table size is benchmarked in a fresh process, so that the peak resident memory
+(maxrss) of one size is not affected by the others. For each stage this records the
+wall and cpu time (best of --repeat runs after a warm-up run), the peak traced Python
+memory (tracemalloc) and the process maxrss after the stage, the number of rows
+processed and the number of files written. The results are written to a JSON file that
+can be compared with that of another commit using benchmarks.compare.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from chandra_time import DateTime
+
+from benchmarks.synthetic import SIZES, make_guide_stars, make_summary
+from guide_stat_reports import __version__, gui_summarize, toc
+from guide_stat_reports.gui_plots import make_gui_plots
+from guide_stat_reports.gui_stat_reports import NoStarError, star_info
+from guide_stat_reports.summary_store import write_summary
+from guide_stat_reports.table import GuideStatsTable
+
+BAD_THRESH = 0.05
+OBC_BAD_THRESH = 0.05
+
+PREDICTIONS = {"bad_trak_rate": 0.005, "no_trak_rate": 0.001, "obc_bad_rate": 0.07}
+"""
+Predicted rates used for star_info (the fit files are not needed for the benchmark)
+"""
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        default=",".join(SIZES),
+        help=f"Comma-separated table sizes (from {', '.join(SIZES)}) "
+        "or lengths in days",
+    )
+    parser.add_argument(
+        "--stages",
+        help="Comma-separated stages to run (default: all)",
+    )
+    parser.add_argument(
+        "--repeat",
+        default=3,
+        type=int,
+        help="Number of timed runs of each stage",
+    )
+    parser.add_argument(
+        "--no_memory",
+        action="store_true",
+        help="Do not make the extra run of each stage to trace its memory",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        help="Output JSON file (default: bench-<commit>.json)",
+    )
+    return parser
+
+
+def count_files(path):
+    return sum(1 for item in Path(path).rglob("*") if item.is_file())
+
+
+def run_table(stars, _summary, _workdir):
+    GuideStatsTable(stars)
+    return {"rows": len(stars)}
+
+
+def run_star_info(stars, _summary, workdir):
+    outdir = workdir / "star_info"
+    outdir.mkdir(exist_ok=True)
+    tstart, tstop = stars["kalman_tstart"][[0, -1]]
+    try:
+        star_info(
+            stars,
+            predictions=PREDICTIONS,
+            bad_thresh=BAD_THRESH,
+            obc_bad_thresh=OBC_BAD_THRESH,
+            tname="benchmark",
+            range_datestart=DateTime(tstart),
+            range_datestop=DateTime(tstop),
+            outdir=outdir,
+        )
+    except NoStarError:
+        pass
+    return {"rows": len(stars), "files": count_files(outdir)}
+
+
+def run_make_gui_plots(stars, _summary, workdir):
+    outdir = workdir / "plots"
+    tstart, tstop = stars["kalman_tstart"][[0, -1]]
+    names = make_gui_plots(
+        stars, BAD_THRESH, tstart, tstop + 1, outdir=outdir, force=True
+    )
+    return {"rows": len(stars), "files": len(names)}
+
+
+def run_gui_summarize(_stars, summary, workdir):
+    datadir = workdir / "summary_data"
+    webdir = workdir / "summary_web"
+    if not datadir.exists():
+        write_summary(datadir, summary)
+    argv = sys.argv
+    sys.argv = [
+        "guide-stat-reports-summary",
+        "--datadir",
+        str(datadir),
+        "--webdir",
+        str(webdir),
+        "--force",
+    ]
+    try:
+        gui_summarize.main()
+    finally:
+        sys.argv = argv
+    return {"rows": len(summary), "files": count_files(webdir)}
+
+
+def run_toc(_stars, summary, workdir):
+    intervals = list(zip(summary["year"], summary["subid"], strict=True))
+    values = toc.get_toc(workdir, intervals)
+    return {"rows": len(values)}
+
+
+STAGES = {
+    "table": run_table,
+    "star_info": run_star_info,
+    "make_gui_plots": run_make_gui_plots,
+    "gui_summarize": run_gui_summarize,
+    "toc": run_toc,
+}
+"""
+Benchmarked stages. Each is called with the guide stars, summary store and a work
+directory and returns a dict with the number of rows processed (and files written).
+"""
+
+
+def get_maxrss():
+    """
+    Get the peak resident memory of this process in bytes.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def measure(func, args, repeat=3, trace_memory=True):
+    """
+    Measure the time and memory of a function.
+
+    :param func: function to benchmark
+    :param args: function arguments
+    :param repeat: number of timed runs
+    :param trace_memory: make one more run with tracemalloc for the peak memory
+    :returns: dict of results
+    """
+    # untimed first run, which includes the imports done on first use
+    func(*args)
+    walls = []
+    cpus = []
+    for _ in range(repeat):
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        out = func(*args)
+        cpus.append(time.process_time() - cpu0)
+        walls.append(time.perf_counter() - wall0)
+    result = {
+        "wall": min(walls),
+        "wall_max": max(walls),
+        "cpu": min(cpus),
+        **out,
+    }
+    if trace_memory:
+        tracemalloc.start()
+        func(*args)
+        result["peak_mem"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result["maxrss"] = get_maxrss()
+    return result
+
+
+def run_size(n_days, stages, repeat=3, trace_memory=True):
+    """
+    Benchmark the stages on a synthetic table.
+
+    :param n_days: length of the table in days
+    :param stages: list of stage names
+    :param repeat: number of timed runs of each stage
+    :param trace_memory: trace the peak memory of each stage
+    :returns: dict of stage name to results
+    """
+    # the table stage makes the lean table from the full one, the others use it
+    full_stars = make_guide_stars(n_days)
+    stars = GuideStatsTable(full_stars).stars
+    summary = make_summary(n_days)
+    results = {"n_stars": len(stars), "n_intervals": len(summary), "stages": {}}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for stage in stages:
+            workdir = Path(tmpdir) / stage
+            workdir.mkdir()
+            results["stages"][stage] = measure(
+                STAGES[stage],
+                (full_stars if stage == "table" else stars, summary, workdir),
+                repeat=repeat,
+                trace_memory=trace_memory,
+            )
+    return results
+
+
+def get_commit():
+    """
+    Get the current git commit, or None outside a git repository.
+    """
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip()
+
+
+def get_meta():
+    return {
+        "commit": get_commit(),
+        "version": __version__,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+    }
+
+
+def main():
+    args = get_parser().parse_args()
+
+    stages = args.stages.split(",") if args.stages else list(STAGES)
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError(f"unknown stage {stage} (choose from {', '.join(STAGES)})")
+    sizes = {}
+    for size in args.sizes.split(","):
+        sizes[size] = SIZES[size] if size in SIZES else int(size)
+
+    meta = get_meta()
+    report = {"meta": meta, "sizes": {}}
+    for size, n_days in sizes.items():
+        # a new process for each size, so that maxrss is that of this size only
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            result = pool.submit(
+                run_size, n_days, stages, args.repeat, not args.no_memory
+            ).result()
+        report["sizes"][size] = {"n_days": n_days, **result}
+        for stage, values in result["stages"].items():
+            peak = values.get("peak_mem")
+            peak = "" if peak is None else f"  peak {peak / 2**20:8.1f} MiB"
+            print(
+                f"{size:12s} {stage:16s} {values['wall']:8.3f} s"
+                f"  cpu {values['cpu']:8.3f} s{peak}"
+                f"  maxrss {values['maxrss'] / 2**20:8.1f} MiB"
+            )
+
+    out = args.out or Path(f"bench-{meta['commit'] or 'nogit'}.json")
+    with open(out, "w") as fh:
+        json.dump(report, fh, indent=4)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
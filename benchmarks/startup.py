@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Benchmark the startup time of the guide_stat_reports entry points.
+
+Each entry point module is imported in a fresh Python process, several times, and the
+fastest import time is reported. The check fails (exit status 1) if a module takes
+longer than --max_time to import or if it imports one of the HEAVY_MODULES, which
+should only be imported when they are needed.
+
+With --noop, the entry points of NOOP_MODULES are also run in a temporary output
+directory, once to write the reports and then several times with nothing changed. The
+check fails if such a no-op run (the whole process) takes longer than --max_noop_time,
+or if it imports one of the HEAVY_MODULES. This reads the mica guide star table.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+ENTRY_MODULES = [
+    "guide_stat_reports.gui_stat_reports",
+    "guide_stat_reports.toc",
+    "guide_stat_reports.gui_summarize",
+    "guide_stat_reports.pipeline",
+]
+"""
+Modules of the console entry points
+"""
+
+HEAVY_MODULES = [
+    "scipy.stats",
+    "matplotlib",
+    "mica.stats.guide_stats",
+    "chandra_aca.star_probs",
+    "ska_matplotlib",
+]
+"""
+Modules that are slow to import and must not be imported by the entry point modules
+"""
+
+NOOP_MODULES = [
+    "guide_stat_reports.gui_stat_reports",
+    "guide_stat_reports.pipeline",
+]
+"""
+Modules of the entry points whose no-op runs are timed with --noop
+"""
+
+IMPORT_SCRIPT = """
+import json, sys, time
+heavy = json.loads(sys.argv[2])
+t0 = time.perf_counter()
+__import__(sys.argv[1])
+dt = time.perf_counter() - t0
+print(json.dumps({"time": dt, "heavy": [name for name in heavy if name in sys.modules]}))
+"""
+
+RUN_SCRIPT = """
+import json, sys
+module = __import__(sys.argv[1], fromlist=["main"])
+heavy = json.loads(sys.argv[2])
+sys.argv = [sys.argv[1], *json.loads(sys.argv[3])]
+module.main()
+print(json.dumps({"heavy": [name for name in heavy if name in sys.modules]}))
+"""
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat",
+        default=5,
+        type=int,
+        help="Number of times each module is imported",
+    )
+    parser.add_argument(
+        "--max_time",
+        default=0.5,
+        type=float,
+        help="Maximum import time (secs) of each module",
+    )
+    parser.add_argument(
+        "--noop",
+        action="store_true",
+        help="Also time the runs of the entry points when nothing changed",
+    )
+    parser.add_argument(
+        "--max_noop_time",
+        default=1.0,
+        type=float,
+        help="Maximum time (secs) of a no-op run, including the interpreter startup",
+    )
+    parser.add_argument(
+        "--days_back",
+        default=30,
+        type=int,
+        help="Days back of the intervals updated by the runs with --noop",
+    )
+    parser.add_argument(
+        "--out",
+        help="Write the results to this JSON file",
+    )
+    return parser
+
+
+def time_import(module, repeat=5):
+    """
+    Time the import of a module in fresh Python processes.
+
+    :param module: module name
+    :param repeat: number of processes
+    :returns: dict with the min and max import time (secs) and the heavy modules
+        that were imported
+    """
+    results = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, module, json.dumps(HEAVY_MODULES)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results.append(json.loads(proc.stdout))
+    times = [result["time"] for result in results]
+    return {
+        "min_time": min(times),
+        "max_time": max(times),
+        "heavy": results[0]["heavy"],
+    }
+
+
+def time_noop_run(module, run_args, repeat=5):
+    """
+    Time the runs of an entry point in which nothing changed.
+
+    The entry point is run once to write its outputs, and then ``repeat`` times.
+
+    :param module: module name (with a main function)
+    :param run_args: command-line arguments of the entry point
+    :param repeat: number of timed runs
+    :returns: dict with the min and max time (secs) of the timed runs and the heavy
+        modules that were imported
+    """
+    cmd = [
+        sys.executable,
+        "-c",
+        RUN_SCRIPT,
+        module,
+        json.dumps(HEAVY_MODULES),
+        json.dumps(run_args),
+    ]
+    subprocess.run(cmd, capture_output=True, check=True)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - t0)
+    # the entry point may log to stdout, the result is the last line
+    result = json.loads(proc.stdout.splitlines()[-1])
+    return {"min_time": min(times), "max_time": max(times), "heavy": result["heavy"]}
+
+
+def get_status(result, max_time):
+    """
+    Get the status of a timed module.
+
+    :param result: dict from time_import or time_noop_run
+    :param max_time: maximum time (secs)
+    :rtype: str
+    """
+    if result["heavy"]:
+        return f"FAIL (imports {', '.join(result['heavy'])})"
+    if result["min_time"] > max_time:
+        return f"FAIL (more than {max_time} s)"
+    return "ok"
+
+
+def main():
+    args = get_parser().parse_args()
+
+    results = {}
+    ok = True
+    for module in ENTRY_MODULES:
+        result = time_import(module, args.repeat)
+        results[module] = result
+        status = get_status(result, args.max_time)
+        ok = ok and status == "ok"
+        print(
+            f"{module:48s} {result['min_time']:6.3f} s"
+            f" (max {result['max_time']:6.3f} s)  {status}"
+        )
+
+    if args.noop:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            run_args = [
+                f"--datadir={tmpdir}/data",
+                f"--webdir={tmpdir}/web",
+                f"--days_back={args.days_back}",
+            ]
+            for module in NOOP_MODULES:
+                result = time_noop_run(module, run_args, args.repeat)
+                results[f"{module} (no-op run)"] = result
+                status = get_status(result, args.max_noop_time)
+                ok = ok and status == "ok"
+                print(
+                    f"{module + ' (no-op run)':48s} {result['min_time']:6.3f} s"
+                    f" (max {result['max_time']:6.3f} s)  {status}"
+                )
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=4)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Synthetic guide star tables and summary stores for the benchmarks.
+
+The guide star tables have the columns of mica.stats.guide_stats that are used by the
+reports, with distributions that roughly follow the real data, so they can be used
+without access to the mica database.
+"""
+
+import datetime
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.aggregates import FAIL_TYPES
+from guide_stat_reports.summary_store import SUMMARY_DTYPE
+
+GUIDE_STARS_DTYPE = [
+    ("obsid", "i4"),
+    ("agasc_id", "i4"),
+    ("kalman_tstart", "f8"),
+    ("f_track", "f8"),
+    ("f_obc_bad", "f8"),
+    ("mag_aca", "f4"),
+    ("aoacmag_mean", "f8"),
+    ("color", "f4"),
+]
+"""
+Columns of the synthetic guide star tables
+"""
+
+STARS_PER_DAY = 40
+"""
+Average number of guide stars per day (about the mission average)
+"""
+
+MISSION_START = "1999:204:00:00:00.000"
+"""
+Start of the Chandra mission
+"""
+
+MISSION_STOP = "2025:001:00:00:00.000"
+"""
+End of the synthetic tables. This is fixed so that results are comparable over time.
+"""
+
+MISSION_DAYS = round(DateTime(MISSION_STOP) - DateTime(MISSION_START))
+
+SIZES = {
+    "month": 30,
+    "year": 365,
+    "mission": MISSION_DAYS,
+    "10x_mission": 10 * MISSION_DAYS,
+}
+"""
+Length in days of the standard benchmark tables
+"""
+
+
+def make_guide_stars(n_days, stars_per_day=STARS_PER_DAY, seed=0):
+    """
+    Make a synthetic guide star table ending at MISSION_STOP.
+
+    About 1% of the stars have a partial track fraction and 0.2% are not tracked at
+    all, 8% have some OBC bad status, and 10% are from ER observations.
+
+    :param n_days: length of the table in days
+    :param stars_per_day: average number of stars per day
+    :param seed: random seed
+    :returns: structured array with GUIDE_STARS_DTYPE, sorted by kalman_tstart
+    """
+    rng = np.random.default_rng(seed)
+    n_stars = int(n_days * stars_per_day)
+    tstop = DateTime(MISSION_STOP).secs
+    tstart = tstop - n_days * 86400
+
+    stars = np.zeros(n_stars, dtype=GUIDE_STARS_DTYPE)
+    stars["kalman_tstart"] = np.sort(rng.uniform(tstart, tstop, n_stars))
+    er = rng.random(n_stars) < 0.1
+    stars["obsid"] = np.where(
+        er, rng.integers(38000, 65536, n_stars), rng.integers(0, 38000, n_stars)
+    )
+    stars["agasc_id"] = rng.integers(1, 2**31 - 1, n_stars)
+    stars["mag_aca"] = rng.triangular(5.5, 10.3, 10.9, n_stars)
+    stars["color"] = rng.uniform(-0.3, 1.8, n_stars)
+    stars["aoacmag_mean"] = stars["mag_aca"] + rng.normal(0, 0.2, n_stars)
+
+    f_track = np.ones(n_stars)
+    partial = rng.random(n_stars) < 0.01
+    f_track[partial] = rng.random(np.count_nonzero(partial))
+    f_track[rng.random(n_stars) < 0.002] = 0
+    stars["f_track"] = f_track
+
+    obc_bad = rng.random(n_stars) < 0.08
+    stars["f_obc_bad"][obc_bad] = rng.random(np.count_nonzero(obc_bad))
+    return stars
+
+
+def _date(dt):
+    return dt.strftime("%Y:%j:%H:%M:%S.000")
+
+
+def get_intervals(n_days):
+    """
+    Get the report intervals (months, quarters, semesters and years) of a time span.
+
+    Quarters and semesters follow the ska_report_ranges convention of ending with the
+    first month of the calendar quarter or semester (e.g. Q1 is November to January).
+
+    :param n_days: length of the span in days, ending at MISSION_STOP
+    :returns: list of (year, subid, datestart, datestop)
+    """
+    stop = datetime.datetime.strptime(MISSION_STOP[:8], "%Y:%j")
+    start = stop - datetime.timedelta(days=n_days)
+
+    def month_start(year, month):
+        return datetime.datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+    spans = {"M": 1, "Q": 3, "S": 6, "YEAR": 12}
+    intervals = []
+    for year in range(start.year, stop.year + 1):
+        for prefix, span in spans.items():
+            count = 12 // span
+            for idx in range(count):
+                first_month = 1 + idx * span
+                if prefix in ["Q", "S"]:
+                    first_month -= span - 1
+                t0 = month_start(year, first_month)
+                t1 = month_start(year, first_month + span)
+                if t0 < start or t1 > stop:
+                    continue
+                if prefix == "M":
+                    subid = f"M{idx + 1:02d}"
+                elif prefix == "YEAR":
+                    subid = "YEAR"
+                else:
+                    subid = f"{prefix}{idx + 1}"
+                intervals.append((str(year), subid, _date(t0), _date(t1)))
+    return intervals
+
+
+def make_summary(n_days, seed=0):
+    """
+    Make a synthetic summary store covering a time span.
+
+    :param n_days: length of the span in days, ending at MISSION_STOP
+    :param seed: random seed
+    :returns: structured array with SUMMARY_DTYPE
+    """
+    rng = np.random.default_rng(seed)
+    intervals = get_intervals(n_days)
+    summary = np.zeros(len(intervals), dtype=SUMMARY_DTYPE)
+    if not len(intervals):
+        return summary
+    year, subid, datestart, datestop = zip(*intervals, strict=True)
+    summary["year"] = year
+    summary["subid"] = subid
+    summary["tname"] = [f"{y}-{s}" for y, s in zip(year, subid, strict=True)]
+    summary["datestart"] = datestart
+    summary["datestop"] = datestop
+    summary["tstart"] = DateTime(summary["datestart"]).secs
+    summary["tstop"] = DateTime(summary["datestop"]).secs
+    n_stars = np.round((summary["tstop"] - summary["tstart"]) / 86400 * STARS_PER_DAY)
+    summary["n_stars"] = n_stars
+    for ftype, rate in zip(FAIL_TYPES, [0.005, 0.001, 0.07], strict=True):
+        summary[f"{ftype}_n_stars"] = rng.binomial(n_stars.astype(int), rate)
+        summary[f"{ftype}_rate"] = summary[f"{ftype}_n_stars"] / n_stars
+        err = np.sqrt(summary[f"{ftype}_n_stars"] + 1) / n_stars
+        summary[f"{ftype}_err_h"] = err
+        summary[f"{ftype}_err_l"] = np.minimum(err, summary[f"{ftype}_rate"])
+        summary[f"{ftype}_rate_pred"] = rate
+        summary[f"{ftype}_n_stars_pred"] = rate * n_stars
+        summary[f"{ftype}_p_less"] = 0.5
+        summary[f"{ftype}_p_more"] = 0.5
+    return summary
@@ -0,0 +1,349 @@
+"""
+Aggregate counts of the guide stars in a report interval.
+
+These are the sufficient statistics of a report: the number of stars and of failures of
+each type, overall and per magnitude bin, and the histogram counts of the plots. The
+counts of an interval are stored next to its rep.json. Counts are additive, so the
+counts of a quarter, semester or year can be computed by summing those of its months
+instead of going through all of its stars again. The lists of failed stars and the
+scatter plots of an interval still go through its stars.
+"""
+
+import json
+import logging
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.table import get_fingerprint
+
+logger = logging.getLogger("acq_stat_reports")
+
+FAIL_TYPES = ["bad_trak", "no_trak", "obc_bad"]
+"""
+Guide star failure types
+"""
+
+AGGREGATES_FILE = "aggregates.npz"
+"""
+Name of the file, next to rep.json, with the aggregate counts of a report interval
+"""
+
+MAG_HIST_BINS = np.arange(5.5 - (0.1 / 2), 12 + (0.1 / 2), 0.1)
+"""
+Bin edges of the magnitude histograms
+"""
+
+COLOR_HIST_BINS = np.arange(-0.5 - (0.1 / 2), 2 + (0.1 / 2), 0.1)
+"""
+Bin edges of the color histograms
+"""
+
+ER_MIN_OBSID = 38000
+"""
+Observations with this obsid or above are engineering requests (ER)
+"""
+
+FLAG_BITS = {"bad_trak": 1, "no_trak": 2, "obc_bad": 4, "tracked": 8, "er": 16}
+"""
+Bits of the classification flags of each star (see get_flags)
+"""
+
+N_FLAG_VALUES = 32
+"""
+Number of possible values of the flags
+"""
+
+
+def get_flags(stars, bad_thresh, obc_bad_thresh):
+    """
+    Classify guide stars into failure types, tracked stars and ER stars.
+
+    :param stars: guide stars
+    :param bad_thresh: bad_trak threshold
+    :param obc_bad_thresh: obc_bad threshold
+    :returns: uint8 array with the FLAG_BITS of each star set
+    """
+    masks = {
+        **_get_fail_masks(stars, bad_thresh, obc_bad_thresh),
+        "tracked": stars["f_track"] > 0,
+        "er": stars["obsid"] >= ER_MIN_OBSID,
+    }
+    flags = np.zeros(len(stars), dtype=np.uint8)
+    for name, mask in masks.items():
+        np.bitwise_or(flags, FLAG_BITS[name], out=flags, where=mask)
+    return flags
+
+
+def add_flags(table, bad_thresh, obc_bad_thresh):
+    """
+    Add the classification flags of all stars to a table, as the flags column.
+
+    The thresholds are kept in the table meta, and the failure masks and counts of any
+    range of the table come from the flags when they are computed with the same
+    thresholds.
+
+    :param table: GuideStatsTable
+    :param bad_thresh: bad_trak threshold
+    :param obc_bad_thresh: obc_bad threshold
+    """
+    table.stars.columns["flags"] = get_flags(table.stars, bad_thresh, obc_bad_thresh)
+    table.stars.meta["flag_thresholds"] = [bad_thresh, obc_bad_thresh]
+
+
+def get_star_flags(stars, bad_thresh=None, obc_bad_thresh=None):
+    """
+    Get the flags column of stars from a table with flags (see add_flags).
+
+    :param stars: guide stars
+    :param bad_thresh: bad_trak threshold the flags must have been computed with
+    :param obc_bad_thresh: obc_bad threshold the flags must have been computed with
+        (the thresholds are not checked if both are None)
+    :returns: flags, or None if the stars have no flags for these thresholds
+    """
+    meta = getattr(stars, "meta", {})
+    if "flag_thresholds" not in meta:
+        return None
+    if (bad_thresh, obc_bad_thresh) != (None, None) and meta["flag_thresholds"] != [
+        bad_thresh,
+        obc_bad_thresh,
+    ]:
+        return None
+    return stars["flags"]
+
+
+def get_flag_mask(flags, name):
+    """
+    Get which stars have a flag set.
+
+    :param flags: flags (from get_flags)
+    :param name: flag name (a key of FLAG_BITS)
+    :returns: boolean mask
+    """
+    return (flags & FLAG_BITS[name]) != 0
+
+
+def get_fail_masks(stars, bad_thresh, obc_bad_thresh):
+    """
+    Get which stars count as failures of each type.
+
+    :param stars: guide stars in the time range
+    :param bad_thresh: bad_trak threshold
+    :param obc_bad_thresh: obc_bad threshold
+    :rtype: dict of failure type to boolean mask
+    """
+    flags = get_star_flags(stars, bad_thresh, obc_bad_thresh)
+    if flags is not None:
+        return {ftype: get_flag_mask(flags, ftype) for ftype in FAIL_TYPES}
+    return _get_fail_masks(stars, bad_thresh, obc_bad_thresh)
+
+
+def _get_fail_masks(stars, bad_thresh, obc_bad_thresh):
+    return {
+        "bad_trak": (1.0 - stars["f_track"]) > bad_thresh,
+        "obc_bad": stars["f_obc_bad"] > obc_bad_thresh,
+        "no_trak": stars["f_track"] == 0,
+    }
+
+
+def get_mag_bins(start, stop, width):
+    """
+    Get the edges of magnitude bins of the given width from start to stop.
+
+    The edges are rounded so that they are exact decimal values (e.g. 10.3 rather than
+    10.299999999999999).
+
+    :param start: lower edge of the first bin
+    :param stop: upper edge of the last bin
+    :param width: bin width
+    :rtype: np.ndarray
+    """
+    n_bins = int(round((stop - start) / width))
+    return np.round(start + width * np.arange(n_bins + 1), 6)
+
+
+def get_mag_bin_index(stars, mag_bins):
+    """
+    Get the index of the magnitude bin of each star.
+
+    :param stars: guide stars in the time range
+    :param mag_bins: magnitude bin edges
+    :returns: bin index of each star (-1 or len(mag_bins) - 1 if outside the bins)
+    """
+    return np.digitize(stars["mag_aca"], mag_bins) - 1
+
+
+def get_fail_counts(stars, fail_masks, mag_idx, n_bins):
+    """
+    Count the stars and failures, in total and per magnitude bin.
+
+    The stars and failures per bin are counted with one bincount each, so the cost does
+    not depend on the number of bins.
+
+    :param stars: guide stars in the time range
+    :param fail_masks: dict of failure type to boolean mask (from get_fail_masks)
+    :param mag_idx: magnitude bin index of each star (from get_mag_bin_index)
+    :param n_bins: number of magnitude bins
+    :returns: dict with n_stars, mag_n_stars, {ftype}_n_stars and {ftype}_mag_n_stars
+    """
+    in_bins = (mag_idx >= 0) & (mag_idx < n_bins)
+    counts = {
+        "n_stars": np.array(len(stars)),
+        "mag_n_stars": np.bincount(mag_idx[in_bins], minlength=n_bins),
+    }
+    for ftype in FAIL_TYPES:
+        mask = fail_masks[ftype]
+        counts[f"{ftype}_n_stars"] = np.array(np.count_nonzero(mask))
+        counts[f"{ftype}_mag_n_stars"] = np.bincount(
+            mag_idx[in_bins & mask], minlength=n_bins
+        )
+    return counts
+
+
+def get_flag_counts(flags, mag_idx, n_bins):
+    """
+    Count the stars and failures, in total and per magnitude bin, from their flags.
+
+    This gives the same counts as get_fail_counts, from a single bincount of the
+    (magnitude bin, flags) pairs.
+
+    :param flags: flags of the stars (from get_flags)
+    :param mag_idx: magnitude bin index of each star (from get_mag_bin_index)
+    :param n_bins: number of magnitude bins
+    :returns: dict with n_stars, mag_n_stars, {ftype}_n_stars and {ftype}_mag_n_stars
+    """
+    in_bins = (mag_idx >= 0) & (mag_idx < n_bins)
+    totals = np.bincount(flags, minlength=N_FLAG_VALUES)
+    bin_counts = np.bincount(
+        mag_idx[in_bins] * N_FLAG_VALUES + flags[in_bins],
+        minlength=n_bins * N_FLAG_VALUES,
+    ).reshape(n_bins, N_FLAG_VALUES)
+    counts = {
+        "n_stars": np.array(len(flags)),
+        "mag_n_stars": bin_counts.sum(axis=1),
+    }
+    flag_values = np.arange(N_FLAG_VALUES)
+    for ftype in FAIL_TYPES:
+        has_flag = get_flag_mask(flag_values, ftype)
+        counts[f"{ftype}_n_stars"] = np.array(totals[has_flag].sum())
+        counts[f"{ftype}_mag_n_stars"] = bin_counts[:, has_flag].sum(axis=1)
+    return counts
+
+
+def get_aggregates(stars, bad_thresh, obc_bad_thresh, mag_bins):
+    """
+    Get all aggregate counts of the stars of an interval.
+
+    :param stars: guide stars in the time range
+    :param bad_thresh: bad_trak threshold
+    :param obc_bad_thresh: obc_bad threshold
+    :param mag_bins: magnitude bin edges
+    :rtype: dict of count arrays (see get_fail_counts and get_histograms)
+    """
+    mag_idx = get_mag_bin_index(stars, mag_bins)
+    flags = get_star_flags(stars, bad_thresh, obc_bad_thresh)
+    if flags is not None:
+        counts = get_flag_counts(flags, mag_idx, len(mag_bins) - 1)
+    else:
+        fail_masks = get_fail_masks(stars, bad_thresh, obc_bad_thresh)
+        counts = get_fail_counts(stars, fail_masks, mag_idx, len(mag_bins) - 1)
+    return {**counts, **get_histograms(stars, bad_thresh)}
+
+
+def get_histograms(stars, bad_thresh):
+    """
+    Count the good and bad stars per magnitude and per color bin.
+
+    :param stars: guide stars in the time range
+    :param bad_thresh: bad_trak threshold
+    :rtype: dict with mag_good, mag_bad, color_good and color_bad counts
+    """
+    flags = get_star_flags(stars)
+    if flags is not None and stars.meta["flag_thresholds"][0] == bad_thresh:
+        bad = get_flag_mask(flags, "bad_trak")
+        # f_track is NaN if neither tracked nor no_trak is set
+        good = ~bad & ((flags & (FLAG_BITS["tracked"] | FLAG_BITS["no_trak"])) != 0)
+    else:
+        good = (1.0 - stars["f_track"]) <= bad_thresh
+        bad = (1.0 - stars["f_track"]) > bad_thresh
+    return {
+        "mag_good": np.histogram(stars["mag_aca"][good], MAG_HIST_BINS)[0],
+        "mag_bad": np.histogram(stars["mag_aca"][bad], MAG_HIST_BINS)[0],
+        "color_good": np.histogram(stars["color"][good], COLOR_HIST_BINS)[0],
+        "color_bad": np.histogram(stars["color"][bad], COLOR_HIST_BINS)[0],
+    }
+
+
+def write_aggregates(dataout, counts, stars, *, tstart, tstop, config):
+    """
+    Write the aggregate counts of an interval.
+
+    :param dataout: data directory of the interval
+    :param counts: dict of count arrays
+    :param stars: guide stars in the time range
+    :param tstart: interval start (Chandra secs)
+    :param tstop: interval stop (Chandra secs)
+    :param config: dict of the options the counts depend on
+    """
+    info = {
+        "tstart": tstart,
+        "tstop": tstop,
+        "fingerprint": get_fingerprint(stars),
+        "config": config,
+    }
+    np.savez(dataout / AGGREGATES_FILE, info=json.dumps(info), **counts)
+
+
+def read_aggregates(path):
+    """
+    Read the aggregate counts of an interval.
+
+    :param path: aggregates file
+    :returns: info dict, dict of count arrays
+    """
+    with np.load(path) as fh:
+        counts = {key: fh[key] for key in fh.files}
+    info = json.loads(str(counts.pop("info")))
+    return info, counts
+
+
+def sum_monthly_aggregates(datadir, table, tstart, tstop, config):
+    """
+    Get the aggregate counts of an interval by summing those of its months.
+
+    The stored monthly counts are only used if the months exactly cover the interval,
+    were computed with the same config, and their stars have not changed since. The
+    counts are not computed again: the stars of each month are only hashed to check
+    that they did not change (see get_fingerprint).
+
+    :param datadir: top level data directory
+    :param table: GuideStatsTable of the mission guide stars
+    :param tstart: interval start (Chandra secs)
+    :param tstop: interval stop (Chandra secs)
+    :param config: dict of the options the counts depend on
+    :returns: dict of count arrays, or None if the months do not cover the interval
+    """
+    years = range(int(DateTime(tstart).date[:4]), int(DateTime(tstop).date[:4]) + 1)
+    months = []
+    for year in years:
+        for path in sorted(datadir.glob(f"{year}/M??/{AGGREGATES_FILE}")):
+            info, counts = read_aggregates(path)
+            if info["tstart"] >= tstart and info["tstop"] <= tstop:
+                months.append((info, counts))
+    months.sort(key=lambda month: month[0]["tstart"])
+
+    bounds = (
+        [tstart]
+        + [bound for info, _ in months for bound in (info["tstart"], info["tstop"])]
+        + [tstop]
+    )
+    if not months or bounds[0::2] != bounds[1::2]:
+        logger.debug("Monthly aggregates do not cover the interval")
+        return None
+    for info, _ in months:
+        stars = table.get_range(info["tstart"], info["tstop"])
+        if info["config"] != config or info["fingerprint"] != get_fingerprint(stars):
+            logger.debug(f"Monthly aggregates for {info['tstart']} are out of date")
+            return None
+
+    return {key: sum(counts[key] for _, counts in months) for key in months[0][1]}
@@ -0,0 +1,444 @@
+"""
+Tracking statistics plots of a report interval.
+
+The input arrays of each plot are gathered by get_gui_plot_data, and the plots are
+rendered by write_gui_plots, which skips the plots whose input did not change (from a
+hash of the input stored in GUI_PLOTS_FILE). Scatter plots with many points are drawn
+as density plots.
+"""
+
+import functools
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports import __version__
+from guide_stat_reports.aggregates import (
+    COLOR_HIST_BINS,
+    ER_MIN_OBSID,
+    MAG_HIST_BINS,
+    get_flag_mask,
+    get_histograms,
+    get_star_flags,
+)
+from guide_stat_reports.table import time_slice
+
+GUI_PLOT_FIGSIZE = (5, 2.5)
+"""
+Size of the interval plots (inches)
+"""
+
+SCATTER_MAX_POINTS = 20000
+"""
+Scatter plots with more points than this are drawn as 2-D density (hexbin) plots
+"""
+
+DENSITY_COLORS = {"k": ("darkgray", "black"), "b": ("lightsteelblue", "navy")}
+"""
+Colors of the density plots of each marker color. They start from a light shade of the
+marker color so that bins with a single star remain visible.
+"""
+
+GUI_PLOTS_FILE = "plots.json"
+"""
+Name of the sidecar file, next to the plots, with the hash of the input of each plot
+"""
+
+
+@functools.cache
+def get_density_cmap(color):
+    """
+    Get the colormap of the density plots of a marker color.
+
+    :param color: marker color (a key of DENSITY_COLORS)
+    :rtype: matplotlib.colors.LinearSegmentedColormap
+    """
+    # matplotlib is slow to import and only needed when a plot is rendered
+    from matplotlib.colors import LinearSegmentedColormap  # noqa: PLC0415
+
+    return LinearSegmentedColormap.from_list(
+        f"density_{color}", list(DENSITY_COLORS[color])
+    )
+
+
+def get_gui_plot_data(
+    range_guis, bad_thresh, scatter_max_points=SCATTER_MAX_POINTS, histograms=None
+):
+    """
+    Get the arrays plotted in each of the make_gui_plots figures.
+
+    :param range_guis: gui stars in the range of interest
+    :param bad_thresh: bad_trak threshold
+    :param scatter_max_points: max number of points drawn individually in a scatter plot
+    :param histograms: histogram counts of range_guis (default: from get_histograms)
+    :rtype: dict of plot file name to dict of plot function arguments
+    """
+    if histograms is None:
+        histograms = get_histograms(range_guis, bad_thresh)
+    flags = get_star_flags(range_guis)
+    if flags is not None:
+        tracked = get_flag_mask(flags, "tracked")
+        er_obs = get_flag_mask(flags, "er")
+    else:
+        tracked = range_guis["f_track"] > 0
+        er_obs = range_guis["obsid"] >= ER_MIN_OBSID
+    or_obs = ~er_obs
+    tracked_mag = range_guis["mag_aca"][tracked]
+    dmag = range_guis["aoacmag_mean"][tracked] - tracked_mag
+    return {
+        "mag_histogram.png": {
+            "good": histograms["mag_good"],
+            "bad": histograms["mag_bad"],
+        },
+        "color_histogram.png": {
+            "good": histograms["color_good"],
+            "bad": histograms["color_bad"],
+        },
+        "delta_mag_vs_mag.png": {
+            "mag": tracked_mag,
+            "dmag": dmag,
+            "max_points": scatter_max_points,
+        },
+        "delta_mag_vs_color.png": {
+            "color": range_guis["color"][tracked],
+            "dmag": dmag,
+            "max_points": scatter_max_points,
+        },
+        "frac_not_track_vs_mag.png": {
+            "or_mag": range_guis["mag_aca"][or_obs],
+            "or_frac": 1.0 - range_guis["f_track"][or_obs],
+            "er_mag": range_guis["mag_aca"][er_obs],
+            "er_frac": 1.0 - range_guis["f_track"][er_obs],
+            "max_points": scatter_max_points,
+        },
+        "frac_bad_obc_status.png": {
+            "or_mag": range_guis["mag_aca"][or_obs],
+            "or_frac": range_guis["f_obc_bad"][or_obs],
+            "er_mag": range_guis["mag_aca"][er_obs],
+            "er_frac": range_guis["f_obc_bad"][er_obs],
+            "max_points": scatter_max_points,
+        },
+    }
+
+
+def get_plot_hash(data):
+    """
+    Get a hash of the input arrays of a plot (and of the package version).
+
+    :param data: dict of arrays (or scalars)
+    :rtype: str
+    """
+    hasher = hashlib.sha256(__version__.encode())
+    for key in sorted(data):
+        arr = np.ascontiguousarray(data[key])
+        hasher.update(f"{key}:{arr.dtype.str}:{arr.shape}".encode())
+        hasher.update(arr.tobytes())
+    return hasher.hexdigest()
+
+
+def hist_outline(bins, counts):
+    """
+    Get the outline of a histogram from its bin edges and counts.
+
+    This gives the same (x, y) as ska_matplotlib.hist_outline, but from counts that
+    were already computed (and possibly summed over several intervals).
+
+    :param bins: bin edges
+    :param counts: counts per bin
+    :returns: x, y
+    """
+    n_edges = len(bins)
+    x = np.zeros(2 * n_edges + 2)
+    y = np.zeros(2 * n_edges + 2)
+    x[1:-1:2] = bins
+    x[2:-1:2] = bins + (bins[1] - bins[0])
+    x[0] = x[1]
+    x[-1] = x[-2]
+    y[1 : 2 * n_edges - 1 : 2] = counts
+    y[2 : 2 * n_edges - 1 : 2] = counts
+    return x, y
+
+
+def _plot_histogram(fig, good, bad, *, bins, xlabel, xlim, title):
+    tiny_y = 0.1
+    ax = fig.add_subplot()
+    # use unfilled histograms from a scipy example
+    (x, data) = hist_outline(bins, good)
+    ax.semilogy(x, data + tiny_y, "k-")
+    (x, data) = hist_outline(bins, bad)
+    ax.semilogy(x, 100 * data + tiny_y, "r-")
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("N stars (red is x100)")
+    ax.set_xlim(*xlim)
+    ax.set_title(title)
+
+
+def plot_mag_histogram(fig, good, bad):
+    """Scaled failure histogram, full mag range (counts in MAG_HIST_BINS)"""
+    _plot_histogram(
+        fig,
+        good,
+        bad,
+        bins=MAG_HIST_BINS,
+        xlabel="Star magnitude (mag)",
+        xlim=(5, 12),
+        title="N good (black) and bad (red) stars vs Mag",
+    )
+
+
+def plot_color_histogram(fig, good, bad):
+    """Scaled failure histogram vs color (counts in COLOR_HIST_BINS)"""
+    _plot_histogram(
+        fig,
+        good,
+        bad,
+        bins=COLOR_HIST_BINS,
+        xlabel="Color (B-V)",
+        xlim=(-0.5, 2),
+        title="N good (black) and bad (red) stars vs Color",
+    )
+
+
+def _use_density(n_points, max_points):
+    # max_points of 0 (or None) turns off the density mode
+    return bool(max_points) and n_points > max_points
+
+
+def _plot_delta_mag(fig, x, dmag, *, max_points, xlabel, title):
+    ax = fig.add_subplot()
+    if _use_density(len(x), max_points):
+        ax.hexbin(
+            x, dmag, gridsize=(60, 20), bins="log", mincnt=1, cmap=get_density_cmap("k")
+        )
+    else:
+        ax.plot(x, dmag, "k.", markersize=2)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Observed - AGASC mag")
+    ax.set_title(title)
+    ax.grid(True)
+    ax.set_ylim(np.min([-4, np.min(dmag)]), np.max([4, np.max(dmag)]))
+
+
+def plot_delta_mag_vs_mag(fig, mag, dmag, max_points=SCATTER_MAX_POINTS):
+    """Delta mag vs mag"""
+    _plot_delta_mag(
+        fig,
+        mag,
+        dmag,
+        max_points=max_points,
+        xlabel="AGASC magnitude (mag)",
+        title="Delta Mag vs Mag",
+    )
+
+
+def plot_delta_mag_vs_color(fig, color, dmag, max_points=SCATTER_MAX_POINTS):
+    """Delta mag vs color"""
+    _plot_delta_mag(
+        fig,
+        color,
+        dmag,
+        max_points=max_points,
+        xlabel="Color (B-V)",
+        title="Delta Mag vs Color",
+    )
+
+
+def _plot_frac_vs_mag(
+    fig, or_mag, or_frac, er_mag, er_frac, *, max_points, ylabel, title
+):
+    ax = fig.add_subplot()
+    # Only positive fractions show up on the log scale. Above max_points, the OR stars
+    # are drawn as a density plot, but the ER stars (red) are always drawn in full.
+    or_ok = or_frac > 0
+    if _use_density(np.count_nonzero(or_ok), max_points):
+        ax.hexbin(
+            or_mag[or_ok],
+            or_frac[or_ok],
+            yscale="log",
+            gridsize=(60, 20),
+            bins="log",
+            mincnt=1,
+            cmap=get_density_cmap("b"),
+            label="OR",
+        )
+    else:
+        ax.semilogy(or_mag, or_frac, "b.", alpha=0.5, markersize=4, label="OR")
+    ax.semilogy(er_mag, er_frac, "r.", alpha=0.5, markersize=4, label="ER")
+    ax.set_xlabel("AGASC magnitude (mag)")
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.legend(
+        loc="upper left",
+        fontsize="x-small",
+        numpoints=1,
+        labelspacing=0.1,
+        handletextpad=0.1,
+    )
+    ax.grid(True)
+    ax.set_ylim(1e-5, 5)
+
+
+def plot_frac_not_track_vs_mag(
+    fig, or_mag, or_frac, er_mag, er_frac, *, max_points=SCATTER_MAX_POINTS
+):
+    """Fraction not tracking vs mag"""
+    _plot_frac_vs_mag(
+        fig,
+        or_mag,
+        or_frac,
+        er_mag,
+        er_frac,
+        max_points=max_points,
+        ylabel="Fraction Not Tracking",
+        title="Fraction Not tracking vs Mag",
+    )
+
+
+def plot_frac_bad_obc_status(
+    fig, or_mag, or_frac, er_mag, er_frac, *, max_points=SCATTER_MAX_POINTS
+):
+    """Fraction bad status vs mag"""
+    _plot_frac_vs_mag(
+        fig,
+        or_mag,
+        or_frac,
+        er_mag,
+        er_frac,
+        max_points=max_points,
+        ylabel="Frac obc bad stat",
+        title="Frac obc bad stat vs mag",
+    )
+
+
+GUI_PLOTS = {
+    "mag_histogram.png": plot_mag_histogram,
+    "color_histogram.png": plot_color_histogram,
+    "delta_mag_vs_mag.png": plot_delta_mag_vs_mag,
+    "delta_mag_vs_color.png": plot_delta_mag_vs_color,
+    "frac_not_track_vs_mag.png": plot_frac_not_track_vs_mag,
+    "frac_bad_obc_status.png": plot_frac_bad_obc_status,
+}
+"""
+Plot function of each of the make_gui_plots figures
+"""
+
+
+def render_gui_plot(name, data, outdir):
+    """
+    Render one of the make_gui_plots figures and save it to outdir / name.
+
+    This uses its own Figure instead of pyplot, so it has no global state and several
+    plots can be rendered at the same time in worker processes.
+
+    :param name: plot file name (a key of GUI_PLOTS)
+    :param data: dict of plot function arguments (from get_gui_plot_data)
+    :param outdir: output directory
+    """
+    # matplotlib is slow to import and only needed when a plot is rendered
+    from matplotlib.figure import Figure  # noqa: PLC0415
+
+    fig = Figure(figsize=GUI_PLOT_FIGSIZE)
+    GUI_PLOTS[name](fig, **data)
+    fig.tight_layout()
+    fig.savefig(outdir / name)
+
+
+def make_gui_plots(
+    guis,
+    bad_thresh,
+    tstart=0,
+    tstop=None,
+    outdir="plots",
+    *,
+    jobs=1,
+    force=False,
+    scatter_max_points=SCATTER_MAX_POINTS,
+    histograms=None,
+):
+    """Make range of tracking statistics plots.
+
+    Makes the following plots:
+    mag_histogram.png - histogram of track failures vs magnitude
+    color_histogram.png - histogram of track failuers vs color
+    delta_mag_vs_mag.png
+    delta_mag_vs_color.png
+    frac_not_track_vs_mag.png
+    frac_not_track_plus_status.png
+
+    A hash of the input of each plot is stored in GUI_PLOTS_FILE, and plots whose
+    input did not change since they were last made are not rendered again.
+
+    Scatter plots with more than scatter_max_points points are drawn as density plots,
+    so that the rendering time does not grow with the size of the range. ER stars are
+    always drawn as individual points.
+
+    :param guis: gui stars sorted by kalman_tstart (e.g. from GuideStatsTable)
+    :param tstart: range of interest tstart (Chandra secs)
+    :param tstop: range of interest tstop (Chandra secs)
+    :param outdir: output directory for pngs
+    :param jobs: number of processes used to render the plots
+    :param force: render all plots even if their input did not change
+    :param scatter_max_points: max number of points drawn individually in a scatter plot
+        (0 to always draw all points)
+    :param histograms: histogram counts of the range (default: from get_histograms)
+    :returns: list of the plots that were rendered
+    """
+    if tstop is None:
+        tstop = DateTime().secs
+
+    range_guis = time_slice(guis, tstart, tstop)
+    plot_data = get_gui_plot_data(
+        range_guis, bad_thresh, scatter_max_points, histograms=histograms
+    )
+    return write_gui_plots(plot_data, outdir, jobs=jobs, force=force)
+
+
+def write_gui_plots(plot_data, outdir, *, jobs=1, force=False):
+    """
+    Render and write the tracking statistics plots of one interval.
+
+    A hash of the input of each plot is stored in GUI_PLOTS_FILE, and plots whose
+    input did not change since they were last made are not rendered again.
+
+    :param plot_data: dict of plot name to plot input (from get_gui_plot_data)
+    :param outdir: output directory for pngs
+    :param jobs: number of processes used to render the plots
+    :param force: render all plots even if their input did not change
+    :returns: list of the plots that were rendered
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(exist_ok=True, parents=True)
+    hashes = {name: get_plot_hash(data) for name, data in plot_data.items()}
+
+    sidecar = outdir / GUI_PLOTS_FILE
+    try:
+        old_hashes = json.loads(sidecar.read_text())
+    except (OSError, ValueError):
+        old_hashes = {}
+    names = [
+        name
+        for name in GUI_PLOTS
+        if force or old_hashes.get(name) != hashes[name] or not (outdir / name).exists()
+    ]
+
+    if jobs > 1 and len(names) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+        ) as pool:
+            futures = [
+                pool.submit(render_gui_plot, name, plot_data[name], outdir)
+                for name in names
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for name in names:
+            render_gui_plot(name, plot_data[name], outdir)
+
+    sidecar.write_text(json.dumps(hashes, sort_keys=True, indent=4))
+    return names
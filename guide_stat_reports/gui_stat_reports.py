@@ -5,26 +5,83 @@ Generate acquisition statistics report.
 
 import argparse
 import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import jinja2
-import matplotlib
 import numpy as np
-import scipy.stats
-
-if __name__ == "__main__":
-    # Matplotlib setup
-    # Use Agg backend for command-line (non-interactive) operation
-    matplotlib.use("Agg")
-
-import matplotlib.pyplot as plt
-import mica.stats.guide_stats
-import ska_matplotlib
 import ska_report_ranges
-from chandra_aca.star_probs import binomial_confidence_interval
 from chandra_time import DateTime
 from ska_helpers import logging
 
+from guide_stat_reports import __version__
+from guide_stat_reports.aggregates import (
+    FAIL_TYPES,
+    add_flags,
+    get_aggregates,
+    get_fail_counts,
+    get_fail_masks,
+    get_mag_bin_index,
+    get_mag_bins,
+    sum_monthly_aggregates,
+    write_aggregates,
+)
+from guide_stat_reports.gui_plots import (
+    SCATTER_MAX_POINTS,
+    get_gui_plot_data,
+    # moved to gui_plots, still importable from here
+    make_gui_plots,  # noqa: F401
+    write_gui_plots,
+)
+from guide_stat_reports.predictions import get_fit_file_hashes, predict_rate
+from guide_stat_reports.snapshot import (
+    SNAPSHOT_DIR,
+    get_source_file,
+    get_source_info,
+    load_table,
+)
+from guide_stat_reports.summary_store import SUMMARY_FILE, upsert_summary
+from guide_stat_reports.table import GuideStatsTable, get_fingerprint
+from guide_stat_reports.timings import TIMINGS_FILE, Timings
+
+EMPTY_STAR_LIST = "no_stars_list.html"
+"""
+Page shared by all the empty lists of failed stars of an interval
+"""
+
+MAG_BINS = get_mag_bins(10.0, 10.9, 0.1)
+"""
+Default magnitude bin edges of the by_mag failure statistics
+"""
+
+MANIFEST_FILE = "manifest.json"
+"""
+Name of the file, next to rep.json, with the fingerprint of the inputs of a report
+"""
+
+HEARTBEAT_FILE = "heartbeat"
+"""
+Name of the file in the data directory that is rewritten at each poll with --watch, so
+that a stuck process can be found from its age (as with the heartbeat_timeout of
+task_schedule)
+"""
+
+RUN_STATE_FILE = "last_run.json"
+"""
+Name of the file in the data directory with the inputs of the last complete run, used
+to exit early when they have not changed
+"""
+
+
+def format_mag(mag):
+    """
+    Format a magnitude bin edge for file names (e.g. 10.0, 10.25).
+    """
+    return np.format_float_positional(mag, min_digits=1)
+
+
 jinja_env = jinja2.Environment(
     loader=jinja2.FileSystemLoader(Path(__file__).parent / "templates" / "guide_stats")
 )
@@ -50,6 +107,78 @@ def get_parser():
     parser.add_argument("--bad_thresh", type=float, default=0.05)
     parser.add_argument("--obc_bad_thresh", type=float, default=0.05)
     parser.add_argument("--days_back", default=30, type=int)
+    parser.add_argument(
+        "--mag_bin_start",
+        default=MAG_BINS[0],
+        type=float,
+        help="Lower edge of the first magnitude bin of the by-magnitude statistics",
+    )
+    parser.add_argument(
+        "--mag_bin_stop",
+        default=MAG_BINS[-1],
+        type=float,
+        help="Upper edge of the last magnitude bin of the by-magnitude statistics",
+    )
+    parser.add_argument(
+        "--mag_bin_width",
+        default=0.1,
+        type=float,
+        help="Width of the magnitude bins of the by-magnitude statistics",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes used to update report intervals in parallel",
+    )
+    parser.add_argument(
+        "--plot_jobs",
+        default=1,
+        type=int,
+        help="Number of processes used to render the plots of an interval "
+        "(only used with --jobs 1)",
+    )
+    parser.add_argument(
+        "--scatter_max_points",
+        default=SCATTER_MAX_POINTS,
+        type=int,
+        help="Scatter plots with more points are drawn as density plots (0 to disable)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate reports even if their inputs have not changed",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help=f"Load the guide stars from a memory-mapped snapshot in {SNAPSHOT_DIR} "
+        "in the data directory, which is updated when the mica table changes",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Log the time and memory of each stage, and save them in rep.json and "
+        f"in {TIMINGS_FILE} in the data directory",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running, and update the reports, table of contents and summary "
+        "when the guide star table changes or a new interval starts",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        default=60,
+        type=float,
+        help="Seconds between checks of the guide star table with --watch",
+    )
+    parser.add_argument(
+        "--heartbeat",
+        help=f"Heartbeat file rewritten at each poll with --watch "
+        f"(default: {HEARTBEAT_FILE} in the data directory)",
+        type=Path,
+    )
 
     verbosity_choices = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
     verbosity_choices += [v.lower() for v in verbosity_choices]
@@ -62,191 +191,77 @@ def get_parser():
     return parser
 
 
-def make_gui_plots(guis, bad_thresh, tstart=0, tstop=None, outdir="plots"):  # noqa: PLR0915
-    """Make range of tracking statistics plots.
+def get_report_config(opt):
+    """
+    Get the command-line options that change the content of a report.
 
-    Makes the following plots:
-    mag_histogram.png - histogram of track failures vs magnitude
-    color_histogram.png - histogram of track failuers vs color
-    delta_mag_vs_mag.png
-    delta_mag_vs_color.png
-    frac_not_track_vs_mag.png
-    frac_not_track_plus_status.png
+    :param opt: parsed command-line options
+    :rtype: dict
+    """
+    mag_bins = get_mag_bins(opt.mag_bin_start, opt.mag_bin_stop, opt.mag_bin_width)
+    return {
+        "bad_thresh": opt.bad_thresh,
+        "obc_bad_thresh": opt.obc_bad_thresh,
+        "mag_bins": [float(mag) for mag in mag_bins],
+        "scatter_max_points": opt.scatter_max_points,
+    }
 
-    :param guis: all mission gui stars as recarray from Ska.DBI.fetchall
-    :param tstart: range of interest tstart (Chandra secs)
-    :param tstop: range of interest tstop (Chandra secs)
-    :param outdir: output directory for pngs
-    :rtype: None
 
+def get_manifest(stars, config):
     """
-    if tstop is None:
-        tstop = DateTime().secs
+    Get the fingerprint of the inputs of one report interval.
 
-    outdir.mkdir(exist_ok=True, parents=True)
+    If the fingerprint of an interval matches the one stored with its last report, the
+    report would come out the same and does not need to be regenerated.
 
-    figsize = (5, 2.5)
-    tiny_y = 0.1
-    range_guis = guis[
-        (guis["kalman_tstart"] >= tstart) & (guis["kalman_tstart"] < tstop)
-    ]
+    :param stars: guide stars in the time range
+    :param config: dict of the options that change the report (see get_report_config)
+    :rtype: dict
+    """
+    return {
+        **get_fingerprint(stars),
+        **config,
+        "fit_files": get_fit_file_hashes(),
+        "version": __version__,
+    }
 
-    # Scaled Failure Histogram, full mag range
-    h = plt.figure(figsize=figsize)
-    mag_bin = 0.1
-    good = range_guis[(1.0 - range_guis["f_track"]) <= bad_thresh]
-    # use unfilled histograms from a scipy example
-    (bins, data) = ska_matplotlib.hist_outline(
-        good["mag_aca"],
-        bins=np.arange(5.5 - (mag_bin / 2), 12 + (mag_bin / 2), mag_bin),
-    )
-    plt.semilogy(bins, data + tiny_y, "k-")
-    bad = range_guis[(1.0 - range_guis["f_track"]) > bad_thresh]
-    (bins, data) = ska_matplotlib.hist_outline(
-        bad["mag_aca"], bins=np.arange(5.5 - (mag_bin / 2), 12 + (mag_bin / 2), mag_bin)
-    )
-    plt.semilogy(bins, 100 * data + tiny_y, "r-")
-    plt.xlabel("Star magnitude (mag)")
-    plt.ylabel("N stars (red is x100)")
-    plt.xlim(5, 12)
-    plt.title("N good (black) and bad (red) stars vs Mag")
-    plt.tight_layout()
-    plt.savefig(outdir / "mag_histogram.png")
-    plt.close(h)
-
-    # Scaled Failure Histogram vs Color
-    h = plt.figure(figsize=figsize)
-    color_bin = 0.1
-    # use unfilled histograms from a scipy example
-    (bins, data) = ska_matplotlib.hist_outline(
-        good["color"],
-        bins=np.arange(-0.5 - (color_bin / 2), 2 + (color_bin / 2), color_bin),
-    )
-    plt.semilogy(bins, data + tiny_y, "k-")
-    (bins, data) = ska_matplotlib.hist_outline(
-        bad["color"],
-        bins=np.arange(-0.5 - (color_bin / 2), 2 + (color_bin / 2), color_bin),
-    )
-    plt.semilogy(bins, 100 * data + tiny_y, "r-")
-    plt.xlabel("Color (B-V)")
-    plt.ylabel("N stars (red is x100)")
-    plt.xlim(-0.5, 2)
-    plt.title("N good (black) and bad (red) stars vs Color")
-    plt.tight_layout()
-    plt.savefig(outdir / "color_histogram.png")
-    plt.close(h)
-
-    # Delta Mag vs Mag
-    h = plt.figure(figsize=figsize)
-    tracked = range_guis[range_guis["f_track"] > 0]
-    plt.plot(
-        tracked["mag_aca"],
-        tracked["aoacmag_mean"] - tracked["mag_aca"],
-        "k.",
-        markersize=2,
-    )
-    plt.xlabel("AGASC magnitude (mag)")
-    plt.ylabel("Observed - AGASC mag")
-    plt.title("Delta Mag vs Mag")
-    plt.grid(True)
-    plt.ylim(
-        np.min([-4, np.min(tracked["aoacmag_mean"] - tracked["mag_aca"])]),
-        np.max([4, np.max(tracked["aoacmag_mean"] - tracked["mag_aca"])]),
-    )
-    plt.tight_layout()
-    plt.savefig(outdir / "delta_mag_vs_mag.png")
-    plt.close(h)
-
-    # Delta Mag vs Color
-    h = plt.figure(figsize=figsize)
-    plt.plot(
-        tracked["color"],
-        tracked["aoacmag_mean"] - tracked["mag_aca"],
-        "k.",
-        markersize=2,
-    )
-    plt.xlabel("Color (B-V)")
-    plt.ylabel("Observed - AGASC mag")
-    plt.title("Delta Mag vs Color")
-    plt.grid(True)
-    plt.ylim(
-        np.min([-4, np.min(tracked["aoacmag_mean"] - tracked["mag_aca"])]),
-        np.max([4, np.max(tracked["aoacmag_mean"] - tracked["mag_aca"])]),
-    )
-    plt.tight_layout()
-    plt.savefig(outdir / "delta_mag_vs_color.png")
-    plt.close(h)
-
-    or_obs = range_guis["obsid"] < 38000
-    er_obs = ~or_obs
-
-    # Fraction not tracking vs Mag
-    h = plt.figure(figsize=figsize)
-    plt.semilogy(
-        range_guis["mag_aca"][or_obs],
-        1.0 - range_guis["f_track"][or_obs],
-        "b.",
-        alpha=0.5,
-        markersize=4,
-        label="OR",
-    )
-    plt.semilogy(
-        range_guis["mag_aca"][er_obs],
-        1.0 - range_guis["f_track"][er_obs],
-        "r.",
-        alpha=0.5,
-        markersize=4,
-        label="ER",
-    )
-    plt.xlabel("AGASC magnitude (mag)")
-    plt.ylabel("Fraction Not Tracking")
-    plt.title("Fraction Not tracking vs Mag")
-    plt.legend(
-        loc="upper left",
-        fontsize="x-small",
-        numpoints=1,
-        labelspacing=0.1,
-        handletextpad=0.1,
-    )
-    plt.grid(True)
-    plt.ylim(1e-5, 5)
-    plt.tight_layout()
-    plt.savefig(outdir / "frac_not_track_vs_mag.png")
-    plt.close(h)
-
-    # Fraction bad status vs Mag
-    h = plt.figure(figsize=figsize)
-    plt.semilogy(
-        range_guis["mag_aca"][or_obs],
-        range_guis["f_obc_bad"][or_obs],
-        "b.",
-        alpha=0.5,
-        markersize=4,
-        label="OR",
-    )
-    plt.semilogy(
-        range_guis["mag_aca"][er_obs],
-        range_guis["f_obc_bad"][er_obs],
-        "r.",
-        alpha=0.5,
-        markersize=4,
-        label="ER",
-    )
-    plt.xlabel("AGASC magnitude (mag)")
-    plt.ylabel("Frac obc bad stat")
-    plt.legend(
-        loc="upper left",
-        fontsize="x-small",
-        numpoints=1,
-        labelspacing=0.1,
-        handletextpad=0.1,
-    )
-    plt.title("Frac obc bad stat vs mag")
-    plt.grid(True)
-    plt.ylim(1e-5, 5)
-    plt.tight_layout()
-    plt.savefig(outdir / "frac_bad_obc_status.png")
-    plt.close(h)
+
+def read_manifest(dataout):
+    """
+    Read the manifest stored with the report in dataout.
+
+    :param dataout: data directory of the report interval
+    :rtype: dict or None if there is no complete report
+    """
+    if not (dataout / "rep.json").exists():
+        return None
+    try:
+        with open(dataout / MANIFEST_FILE, "r") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(dataout, manifest):
+    """
+    Write the manifest of the report in dataout.
+
+    :param dataout: data directory of the report interval
+    :param manifest: dict (from get_manifest)
+    """
+    with open(dataout / MANIFEST_FILE, "w") as fh:
+        json.dump(manifest, fh, sort_keys=True, indent=4)
+
+
+def get_dataout(opt, trange):
+    """
+    Get the data directory of a report interval.
+
+    :param opt: parsed command-line options
+    :param trange: interval dict from ska_report_ranges.get_update_ranges
+    :rtype: Path
+    """
+    return opt.datadir / f"{trange['year']}" / f"{trange['subid']}"
 
 
 def make_html(nav_dict, rep_dict, pred_dict, outdir):
@@ -276,6 +291,7 @@ class NoStarError(Exception):
 
 def star_info(
     stars,
+    *,
     predictions,
     bad_thresh,
     obc_bad_thresh,
@@ -283,19 +299,72 @@ def star_info(
     range_datestart,
     range_datestop,
     outdir,
+    mag_bins=None,
+    aggregates=None,
+):
+    """
+    Generate a report dictionary for the time range and write its lists of failed stars.
+
+    See get_interval_report for the parameters.
+
+    :param outdir: output directory of the lists of failed stars
+    :rtype: dict of report values
+    """
+    rep, star_lists = get_interval_report(
+        stars,
+        predictions=predictions,
+        bad_thresh=bad_thresh,
+        obc_bad_thresh=obc_bad_thresh,
+        tname=tname,
+        range_datestart=range_datestart,
+        range_datestop=range_datestop,
+        mag_bins=mag_bins,
+        aggregates=aggregates,
+    )
+    write_star_lists(star_lists, outdir)
+    return rep
+
+
+def get_interval_report(
+    stars,
+    *,
+    predictions,
+    bad_thresh,
+    obc_bad_thresh,
+    tname,
+    range_datestart,
+    range_datestop,
+    mag_bins=None,
+    aggregates=None,
 ):
     """
-    Generate a report dictionary for the time range.
+    Generate a report dictionary and the lists of failed stars for the time range.
+
+    The statistics are computed from the aggregate counts of the range, which are
+    counted from the stars unless given (e.g. as the sum of those of its months).
+    The stars themselves are only used for the lists of failed stars: these take one
+    pass over the failure flags (or columns) of all stars of the range, and the
+    magnitude bins are then only computed for the failed stars. Nothing is written.
 
-    :param acqs: recarray of all acquisition stars available in the table
+    :param stars: guide stars in the time range (a view from GuideStatsTable.get_range)
+    :param predictions: dict of {ftype}_rate to predicted rate (from get_predictions)
+    :param bad_thresh: bad_trak threshold
+    :param obc_bad_thresh: obc_bad threshold
     :param tname: timerange string (e.g. 2010-M05)
     :param range_datestart: chandra_time DateTime of start of reporting interval
     :param range_datestop: chandra_time DateTime of end of reporting interval
-    :param pred_start: date for beginning of time range for predictions based
-    on average from pred_start to now()
+    :param mag_bins: magnitude bin edges of the by_mag table (default MAG_BINS)
+    :param aggregates: aggregate counts of the range (from get_aggregates)
 
-    :rtype: dict of report values
+    :returns: dict of report values, dict of star list page name to failed stars
     """
+    # imported here because they are slow to import and not needed for the intervals
+    # that are up to date
+    import scipy.stats  # noqa: PLC0415
+    from chandra_aca.star_probs import binomial_confidence_interval  # noqa: PLC0415
+
+    if mag_bins is None:
+        mag_bins = MAG_BINS
 
     rep = {
         "datestring": tname,
@@ -313,20 +382,22 @@ def star_info(
         ),
     }
 
-    rep["n_stars"] = len(stars)
+    n_bins = len(mag_bins) - 1
+    fail_masks = get_fail_masks(stars, bad_thresh, obc_bad_thresh)
+    if aggregates is None:
+        mag_idx = get_mag_bin_index(stars, mag_bins)
+        aggregates = get_fail_counts(stars, fail_masks, mag_idx, n_bins)
+
+    rep["n_stars"] = int(aggregates["n_stars"])
     rep["fail_types"] = []
-    if not len(stars):
+    if not rep["n_stars"]:
         raise NoStarError("No acq stars in range")
 
-    fail_stars = {
-        "bad_trak": stars[(1.0 - stars["f_track"]) > bad_thresh],
-        "obc_bad": stars[stars["f_obc_bad"] > obc_bad_thresh],
-        "no_trak": stars[stars["f_track"] == 0],
-    }
+    fail_stars = {ftype: stars[mask] for ftype, mask in fail_masks.items()}
 
-    fail_types = ["bad_trak", "no_trak", "obc_bad"]
-    for ftype in fail_types:
-        n_stars = len(fail_stars[ftype])
+    star_lists = {}
+    for ftype in FAIL_TYPES:
+        n_stars = int(aggregates[f"{ftype}_n_stars"])
         r, low, high = binomial_confidence_interval(n_stars, rep["n_stars"])
         trep = {}
         trep["type"] = ftype
@@ -341,181 +412,709 @@ def star_info(
             trep["n_stars"] - 1, trep["n_stars_pred"]
         )
 
-        flat_fails = [
-            {
-                "id": star["agasc_id"],
-                "obsid": star["obsid"],
-                "mag": star["mag_aca"],
-                "mag_obs": star["aoacmag_mean"],
-                "bad_track": (1.0 - star["f_track"]),
-                "obc_bad_status": star["f_obc_bad"],
-                "color": star["color"],
-            }
-            for star in fail_stars[ftype]
-        ]
-
-        outfile = outdir / f"{ftype}_stars_list.html"
-        trep["fail_url"] = outfile.name
+        filename = f"{ftype}_stars_list.html"
+        star_lists[filename] = fail_stars[ftype]
+        trep["fail_url"] = get_star_list_url(filename, fail_stars[ftype])
         rep["fail_types"].append(trep)
-        make_fail_html(flat_fails, outfile)
+
+    # Sort the failed stars by bin (stable, so each bin stays in time order) so that the
+    # failures in a bin are a contiguous slice.
+    fail_by_mag = {}
+    fail_bin_start = {}
+    for ftype in FAIL_TYPES:
+        fail_mag_idx = get_mag_bin_index(fail_stars[ftype], mag_bins)
+        order = np.argsort(fail_mag_idx, kind="stable")
+        fail_by_mag[ftype] = fail_stars[ftype][order]
+        fail_bin_start[ftype] = np.searchsorted(
+            fail_mag_idx[order], np.arange(n_bins + 1)
+        )
 
     rep["by_mag"] = []
     # looping first over mag and then over fail type for a better
     # data structure
-    bin = 0.1
-    for tmag_start in np.arange(10.0, 10.8, 0.1):
-        mag_range_stars = stars[
-            (stars["mag_aca"] >= tmag_start) & (stars["mag_aca"] < (tmag_start + bin))
-        ]
+    for ibin in range(n_bins):
+        n_stars = int(aggregates["mag_n_stars"][ibin])
         mag_rep = {
-            "mag_start": tmag_start,
-            "mag_stop": (tmag_start + bin),
-            "n_stars": len(mag_range_stars),
+            "mag_start": float(mag_bins[ibin]),
+            "mag_stop": float(mag_bins[ibin + 1]),
+            "n_stars": n_stars,
         }
-        for ftype in fail_types:
-            mag_range_fails = fail_stars[ftype][
-                (fail_stars[ftype]["mag_aca"] >= tmag_start)
-                & (fail_stars[ftype]["mag_aca"] < (tmag_start + bin))
-            ]
-            flat_fails = [
-                {
-                    "id": star["agasc_id"],
-                    "obsid": star["obsid"],
-                    "mag": star["mag_aca"],
-                    "mag_obs": star["aoacmag_mean"],
-                    "bad_track": (1.0 - star["f_track"]),
-                    "obc_bad_status": star["f_obc_bad"],
-                    "color": star["color"],
-                }
-                for star in mag_range_fails
-            ]
-            failed_star_file = f"{ftype}_{tmag_start:.1f}_stars_list.html"
-            make_fail_html(flat_fails, outdir / failed_star_file)
-            mag_rep[f"{ftype}_n_stars"] = len(mag_range_fails)
-            mag_rep[f"{ftype}_fail_url"] = failed_star_file
-            if len(mag_range_stars) == 0:
-                mag_rep[f"{ftype}_rate"] = 0
-            else:
-                mag_rep[f"{ftype}_rate"] = (
-                    len(mag_range_fails) * 1.0 / len(mag_range_stars)
-                )
+        for ftype in FAIL_TYPES:
+            i0, i1 = fail_bin_start[ftype][ibin : ibin + 2]
+            failed_star_file = f"{ftype}_{format_mag(mag_bins[ibin])}_stars_list.html"
+            star_lists[failed_star_file] = fail_by_mag[ftype][i0:i1]
+            failed_star_url = get_star_list_url(
+                failed_star_file, star_lists[failed_star_file]
+            )
+            n_fails = int(aggregates[f"{ftype}_mag_n_stars"][ibin])
+            mag_rep[f"{ftype}_n_stars"] = n_fails
+            mag_rep[f"{ftype}_fail_url"] = failed_star_url
+            mag_rep[f"{ftype}_rate"] = n_fails / n_stars if n_stars else 0
         rep["by_mag"].append(mag_rep)
 
-    return rep
+    return rep, star_lists
 
 
-def make_fail_html(fails, outfile):
+def get_predictions(range_datestart, range_datestop):
+    """
+    Get the predicted failure rates of a time range, from the fits at its midpoint.
+
+    :param range_datestart: chandra_time DateTime of start of the range
+    :param range_datestop: chandra_time DateTime of end of the range
+    :returns: dict of {ftype}_rate to predicted rate
+    """
+    half_date = range_datestart + (range_datestop - range_datestart) / 2
+    half_frac_year = half_date.frac_year
+    return {
+        f"{ftype}_rate": predict_rate(ftype, half_frac_year) for ftype in FAIL_TYPES
+    }
+
+
+class IntervalStats:
     """
-    Render and write the expanded table of failed stars
+    Statistics of the guide stars of one time range (from compute_interval_stats).
+
+    Nothing is written to disk until the stats are passed to the writers
+    (write_star_lists, write_gui_plots, make_html and write_aggregates).
+
+    :param tname: name of the range (e.g. 2010-M05)
+    :param datestart: chandra_time DateTime of start of the range
+    :param datestop: chandra_time DateTime of end of the range
+    :param stars: guide stars in the range (a view from GuideStatsTable.get_range)
+    :param thresholds: dict with the bad_thresh and obc_bad_thresh used
+    :param predictions: dict of {ftype}_rate to predicted rate
+    :param aggregates: aggregate counts of the range (from get_aggregates)
+    :param rep: dict of report values (as written to rep.json)
+    :param star_lists: dict of star list page name to failed stars
+    """
+
+    def __init__(
+        self,
+        tname,
+        datestart,
+        datestop,
+        stars,
+        *,
+        thresholds,
+        predictions,
+        aggregates,
+        rep,
+        star_lists,
+    ):
+        self.tname = tname
+        self.datestart = datestart
+        self.datestop = datestop
+        self.stars = stars
+        self.thresholds = thresholds
+        self.predictions = predictions
+        self.aggregates = aggregates
+        self.rep = rep
+        self.star_lists = star_lists
+
+    def get_plot_data(self, scatter_max_points=SCATTER_MAX_POINTS):
+        """
+        Get the input of the tracking statistics plots of the range.
+
+        :param scatter_max_points: max number of points drawn individually in a
+            scatter plot (0 to always draw all points)
+        :returns: dict of plot name to plot input (see get_gui_plot_data)
+        """
+        return get_gui_plot_data(
+            self.stars,
+            self.thresholds["bad_thresh"],
+            scatter_max_points,
+            histograms=self.aggregates,
+        )
+
+
+def compute_interval_stats(
+    table,
+    tstart,
+    tstop,
+    thresholds,
+    predictions=None,
+    *,
+    tname=None,
+    mag_bins=None,
+    aggregates=None,
+):
+    """
+    Compute the statistics of the guide stars in a time range, without writing anything.
+
+    :param table: GuideStatsTable of the mission guide stars
+    :param tstart: start of the range (any chandra_time DateTime format)
+    :param tstop: end of the range (any chandra_time DateTime format)
+    :param thresholds: dict with the bad_thresh and obc_bad_thresh
+    :param predictions: dict of {ftype}_rate to predicted rate (default: from the fits,
+        at the middle of the range)
+    :param tname: name of the range (default: <start date>-<stop date>)
+    :param mag_bins: magnitude bin edges of the by_mag table (default MAG_BINS)
+    :param aggregates: aggregate counts of the range (default: counted from the stars)
+    :rtype: IntervalStats
+    :raises NoStarError: if there are no stars in the range
+    """
+    datestart = DateTime(tstart)
+    datestop = DateTime(tstop)
+    if tname is None:
+        tname = f"{datestart.date[:8]}-{datestop.date[:8]}"
+    if mag_bins is None:
+        mag_bins = MAG_BINS
+    if predictions is None:
+        predictions = get_predictions(datestart, datestop)
+    stars = table.get_range(datestart.secs, datestop.secs)
+    if aggregates is None:
+        aggregates = get_aggregates(
+            stars, thresholds["bad_thresh"], thresholds["obc_bad_thresh"], mag_bins
+        )
+    rep, star_lists = get_interval_report(
+        stars,
+        predictions=predictions,
+        bad_thresh=thresholds["bad_thresh"],
+        obc_bad_thresh=thresholds["obc_bad_thresh"],
+        tname=tname,
+        range_datestart=datestart,
+        range_datestop=datestop,
+        mag_bins=mag_bins,
+        aggregates=aggregates,
+    )
+    return IntervalStats(
+        tname,
+        datestart,
+        datestop,
+        stars,
+        thresholds=thresholds,
+        predictions=predictions,
+        aggregates=aggregates,
+        rep=rep,
+        star_lists=star_lists,
+    )
+
+
+def get_fail_rows(stars):
+    """
+    Get the rows of the expanded table of failed stars.
+
+    The rows are built from whole columns, so no per-star record or dict is created.
+
+    :param stars: failed guide stars
+    :returns: iterator of (id, obsid, mag, mag_obs, color, bad_track, obc_bad_status)
     """
-    nav_dict = {
+    return zip(
+        stars["agasc_id"].tolist(),
+        stars["obsid"].tolist(),
+        stars["mag_aca"].tolist(),
+        stars["aoacmag_mean"].tolist(),
+        stars["color"].tolist(),
+        (1.0 - stars["f_track"]).tolist(),
+        stars["f_obc_bad"].tolist(),
+        strict=True,
+    )
+
+
+def write_if_changed(path, text):
+    """
+    Write text to path unless the file already has exactly that content.
+
+    :param path: output file
+    :param text: file content
+    :returns: True if the file was written
+    """
+    data = text.encode()
+    if path.exists() and path.stat().st_size == len(data) and path.read_bytes() == data:
+        return False
+    path.write_bytes(data)
+    return True
+
+
+def get_star_list_url(filename, stars):
+    """
+    Get the url of the page of a list of failed stars.
+
+    :param filename: name of the page in the output directory
+    :param stars: failed guide stars
+    :returns: url relative to the output directory (all empty lists share one page)
+    """
+    return filename if len(stars) else EMPTY_STAR_LIST
+
+
+def write_star_lists(star_lists, outdir):
+    """
+    Write the expanded tables of failed stars of one interval.
+
+    :param star_lists: dict of page name to failed stars (from get_interval_report)
+    :param outdir: output directory of the interval
+    :returns: number of files written
+    """
+    writer = StarListWriter(outdir)
+    for filename, stars in star_lists.items():
+        writer.add(filename, stars)
+    return writer.write()
+
+
+class StarListWriter:
+    """
+    Batched writer of the expanded tables of failed stars of one interval.
+
+    Pages are collected with ``add`` and rendered with a single compiled template by
+    ``write``. All empty lists share one page (see get_star_list_url), and a page is
+    only rewritten if its content changed.
+
+    :param outdir: output directory of the interval
+    """
+
+    nav = {
         "star_cgi": "https://icxc.harvard.edu/cgi-bin/aspect/get_stats/get_stats.cgi?id=",
         "starcheck_cgi": "https://icxc.harvard.edu/cgi-bin/aspect/starcheck_print/starcheck_print.cgi?sselect=obsid;obsid1=",
     }
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.pages = {}
+        self.empty = []
+
+    def add(self, filename, stars):
+        """
+        Add the page of a list of failed stars.
+
+        :param filename: name of the page in the output directory
+        :param stars: failed guide stars
+        """
+        if get_star_list_url(filename, stars) == EMPTY_STAR_LIST:
+            self.empty.append(filename)
+        else:
+            self.pages[filename] = stars
+
+    def write(self):
+        """
+        Render and write all pages.
+
+        :returns: number of files written
+        """
+        template = jinja_env.get_template("stars.html")
+        pages = {
+            filename: get_fail_rows(stars) for filename, stars in self.pages.items()
+        }
+        if self.empty:
+            pages[EMPTY_STAR_LIST] = []
+        n_written = 0
+        for filename, rows in pages.items():
+            page = template.render(nav=self.nav, fails=rows)
+            n_written += write_if_changed(self.outdir / filename, page)
+        # empty lists used to get their own page
+        for filename in self.empty:
+            (self.outdir / filename).unlink(missing_ok=True)
+        return n_written
+
+
+def make_fail_html(fails, outfile):
+    """
+    Render and write the expanded table of failed stars.
+
+    The reports write these pages with StarListWriter, this writes a single page.
+
+    :param fails: rows of the table (see get_fail_rows)
+    :param outfile: output file
+    """
     template = jinja_env.get_template("stars.html")
-    page = template.render(nav=nav_dict, fails=fails)
-    f = open(outfile, "w")
-    f.write(page)
-    f.close()
+    page = template.render(nav=StarListWriter.nav, fails=fails)
+    write_if_changed(Path(outfile), page)
 
 
-def main():
+def update_interval(table, tname, trange, opt, plot_jobs=1):  # noqa: PLR0915
     """
-    Update star statistics plots.
+    Update the report for one interval.
 
-    Mission averages are computed with all stars from 2003:001 to the end of the interval.
+    :param table: GuideStatsTable of the mission guide stars
+    :param tname: interval name (e.g. 2010-M05)
+    :param trange: interval dict from ska_report_ranges.get_update_ranges
+    :param opt: parsed command-line options
+    :param plot_jobs: number of processes used to render the plots
+    :returns: report dict, or None if the report was not written
     """
-    opt = get_parser().parse_args()
+    logger.debug(f"Attempting to update {tname}")
 
-    logger.setLevel(opt.v.upper())
+    webout = opt.webdir / f"{trange['year']}" / f"{trange['subid']}"
 
-    to_update = ska_report_ranges.get_update_ranges(opt.days_back)
+    logger.debug(f"Writing reports to {webout}")
+    webout.mkdir(exist_ok=True, parents=True)
 
-    for tname in sorted(to_update.keys()):
-        logger.debug(f"Attempting to update {tname}")
+    logger.debug(f"Writing data to {webout}")
+    dataout = get_dataout(opt, trange)
+    dataout.mkdir(exist_ok=True, parents=True)
 
-        webout = (
-            opt.webdir / f"{to_update[tname]['year']}" / f"{to_update[tname]['subid']}"
-        )
+    range_datestart = DateTime(trange["start"])
+    range_datestop = DateTime(trange["stop"])
+    mag_bins = get_mag_bins(opt.mag_bin_start, opt.mag_bin_stop, opt.mag_bin_width)
 
-        logger.debug(f"Writing reports to {webout}")
-        webout.mkdir(exist_ok=True, parents=True)
+    timings = Timings({"interval": tname}, enabled=opt.timings)
+    try:
+        config = get_report_config(opt)
+        with timings.stage("select") as stage:
+            stars = table.get_range(range_datestart.secs, range_datestop.secs)
+            manifest = get_manifest(stars, config)
+            stage.rows = len(stars)
+        if not opt.force and read_manifest(dataout) == manifest:
+            logger.debug(f"Skipping {tname}, inputs have not changed")
+            return None
 
-        logger.debug(f"Writing data to {webout}")
-        dataout = (
-            opt.datadir / f"{to_update[tname]['year']}" / f"{to_update[tname]['subid']}"
-        )
-        dataout.mkdir(exist_ok=True, parents=True)
-
-        range_datestart = DateTime(to_update[tname]["start"])
-        range_datestop = DateTime(to_update[tname]["stop"])
-
-        try:
-            stars = mica.stats.guide_stats.get_stats()
-            stars = stars[
-                (stars["kalman_tstart"] >= DateTime(range_datestart).secs)
-                & (stars["kalman_tstart"] < DateTime(range_datestop).secs)
-            ]
-
-            data_dir = Path(__file__).parent / "data"
-            pred = {
-                "obc_bad": json.load(open(data_dir / "obc_bad_fitfile.json")),
-                "bad_trak": json.load(open(data_dir / "bad_trak_fitfile.json")),
-                "no_trak": json.load(open(data_dir / "no_trak_fitfile.json")),
-            }
-
-            old_pred = {"obc_bad": 0.07, "bad_trak": 0.005, "no_trak": 0.001}
-
-            half_date = range_datestart + (range_datestop - range_datestart) / 2
-            half_frac_year = half_date.frac_year
-            predictions = {}
-            for ftype in pred:
-                if half_frac_year >= DateTime(pred[ftype]["datestart"]).frac_year:
-                    predictions[ftype + "_rate"] = (
-                        pred[ftype]["m"]
-                        * (
-                            half_frac_year
-                            - DateTime(pred[ftype]["datestart"]).frac_year
-                        )
-                        + pred[ftype]["b"]
-                    )
-                else:
-                    predictions[ftype + "_rate"] = old_pred[ftype]
+        # Monthly counts are computed from the stars, longer intervals use the sum of
+        # their months when those are available and up to date.
+        with timings.stage("aggregates", rows=len(stars)):
+            aggregates = None
+            if not is_month(trange):
+                aggregates = sum_monthly_aggregates(
+                    opt.datadir,
+                    table,
+                    range_datestart.secs,
+                    range_datestop.secs,
+                    config,
+                )
+            if aggregates is None:
+                aggregates = get_aggregates(
+                    stars, opt.bad_thresh, opt.obc_bad_thresh, mag_bins
+                )
 
-            rep = star_info(
-                stars,
-                predictions,
-                opt.bad_thresh,
-                opt.obc_bad_thresh,
-                tname,
-                range_datestart,
-                range_datestop,
+        with timings.stage("stats", rows=len(stars)):
+            stats = compute_interval_stats(
+                table,
+                trange["start"],
+                trange["stop"],
+                {"bad_thresh": opt.bad_thresh, "obc_bad_thresh": opt.obc_bad_thresh},
+                tname=tname,
+                mag_bins=mag_bins,
+                aggregates=aggregates,
+            )
+            rep = stats.rep
+        n_listed = sum(len(stars) for stars in stats.star_lists.values())
+        with timings.stage("star_lists", rows=n_listed) as stage:
+            stage.files = write_star_lists(stats.star_lists, webout)
+
+        prev_range = ska_report_ranges.get_prev(trange)
+        next_range = ska_report_ranges.get_next(trange)
+        nav = {
+            "main": "../../index.html",
+            "next": f"../../{next_range['year']}/{next_range['subid']}/index.html",
+            "prev": f"../../{prev_range['year']}/{prev_range['subid']}/index.html",
+        }
+        with timings.stage("plots", rows=len(stars)) as stage:
+            plots = write_gui_plots(
+                stats.get_plot_data(opt.scatter_max_points),
                 webout,
+                jobs=plot_jobs,
+                force=opt.force,
             )
+            stage.files = len(plots)
+        with timings.stage("html", files=1):
+            make_html(nav, rep, stats.predictions, outdir=webout)
 
-            rep_file = open(dataout / "rep.json", "w")
-            rep_file.write(json.dumps(rep, sort_keys=True, indent=4))
-            rep_file.close()
-
-            prev_range = ska_report_ranges.get_prev(to_update[tname])
-            next_range = ska_report_ranges.get_next(to_update[tname])
-            nav = {
-                "main": "../../index.html",
-                "next": f"../../{next_range['year']}/{next_range['subid']}/index.html",
-                "prev": f"../../{prev_range['year']}/{prev_range['subid']}/index.html",
-            }
-            make_gui_plots(
+        with timings.stage("write_data", files=2):
+            write_aggregates(
+                dataout,
+                aggregates,
                 stars,
-                opt.bad_thresh,
                 tstart=range_datestart.secs,
                 tstop=range_datestop.secs,
-                outdir=webout,
+                config=config,
             )
-            make_html(nav, rep, predictions, outdir=webout)
-        except NoStarError:
-            print(f"ERROR: Unable to process {tname}")
-            webout.rmdir()
-            dataout.rmdir()
+
+            # the timings in rep.json are those of the stages before this one
+            if timings.enabled:
+                rep["timings"] = timings.as_dict()
+            with open(dataout / "rep.json", "w") as fh:
+                fh.write(json.dumps(rep, sort_keys=True, indent=4))
+        if timings.enabled:
+            rep["timings"] = timings.as_dict()
+    except NoStarError:
+        print(f"ERROR: Unable to process {tname}")
+        webout.rmdir()
+        dataout.rmdir()
+        return None
+
+    return rep
+
+
+def is_month(trange):
+    """
+    Check whether a report interval is a month.
+
+    :param trange: interval dict from ska_report_ranges.get_update_ranges
+    :rtype: bool
+    """
+    return trange["subid"].startswith("M")
+
+
+# Table shared with the worker processes of update_intervals. It is set before the pool
+# is created, so forked workers inherit it instead of receiving a pickled copy.
+_POOL_TABLE = None
+
+
+def _update_interval_in_pool(tname, trange, opt):
+    return update_interval(_POOL_TABLE, tname, trange, opt)
+
+
+def update_intervals(table, to_update, opt, jobs=1):
+    """
+    Update the reports for several intervals.
+
+    Months are updated first, so that longer intervals can use their aggregate counts.
+    Within each of these two groups the intervals are independent, so with jobs > 1
+    they are spread over a pool of forked processes which share the table with this
+    process. The plots of each interval are then rendered serially in its worker,
+    otherwise they are rendered with opt.plot_jobs processes.
+
+    :param table: GuideStatsTable of the mission guide stars
+    :param to_update: dict of interval name to interval dict
+    :param opt: parsed command-line options
+    :param jobs: number of worker processes
+    :returns: dict of interval name to report dict, for the intervals that were written
+    """
+    global _POOL_TABLE  # noqa: PLW0603
+
+    months = sorted(tname for tname in to_update if is_month(to_update[tname]))
+    others = sorted(tname for tname in to_update if not is_month(to_update[tname]))
+    updated = {}
+    if jobs <= 1 or len(to_update) <= 1:
+        for tname in months + others:
+            rep = update_interval(
+                table, tname, to_update[tname], opt, plot_jobs=opt.plot_jobs
+            )
+            if rep is not None:
+                updated[tname] = rep
+        return updated
+
+    _POOL_TABLE = table
+    try:
+        with ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+        ) as pool:
+            for tnames in (months, others):
+                futures = {
+                    tname: pool.submit(
+                        _update_interval_in_pool, tname, to_update[tname], opt
+                    )
+                    for tname in tnames
+                }
+                for tname in tnames:
+                    rep = futures[tname].result()
+                    if rep is not None:
+                        updated[tname] = rep
+    finally:
+        _POOL_TABLE = None
+    return updated
+
+
+def load_guide_stats(opt, timings):
+    """
+    Load the guide star table and classify its stars.
+
+    :param opt: parsed command-line options
+    :param timings: Timings of the run
+    :rtype: GuideStatsTable
+    """
+    with timings.stage("load") as stage:
+        if opt.snapshot:
+            table = load_table(opt.datadir / SNAPSHOT_DIR)
+        else:
+            table = GuideStatsTable.load()
+        stage.rows = len(table)
+
+    with timings.stage("flags", rows=len(table)):
+        add_flags(table, opt.bad_thresh, opt.obc_bad_thresh)
+    return table
+
+
+def get_run_state(opt, to_update, source_file):
+    """
+    Get the inputs of a run that are known without loading the guide star table.
+
+    :param opt: parsed command-line options
+    :param to_update: dict of interval name to interval dict
+    :param source_file: path of the mica guide star table
+    :rtype: dict
+    :raises OSError: if the table cannot be found
+    """
+    return {
+        "source": get_source_info(source_file),
+        "ska": os.environ.get("SKA"),
+        "intervals": sorted(to_update),
+        "config": get_report_config(opt),
+        "fit_files": get_fit_file_hashes(),
+        "version": __version__,
+    }
+
+
+def read_run_state(datadir):
+    """
+    Read the inputs of the last complete run.
+
+    :param datadir: top level data directory
+    :returns: dict (from get_run_state), or None if there is none
+    """
+    try:
+        with open(datadir / RUN_STATE_FILE, "r") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_run_state(datadir, run_state):
+    """
+    Write the inputs of a complete run.
+
+    :param datadir: top level data directory
+    :param run_state: dict (from get_run_state)
+    """
+    datadir.mkdir(exist_ok=True, parents=True)
+    tmp = datadir / f".{RUN_STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(run_state, fh, sort_keys=True, indent=4)
+    os.replace(tmp, datadir / RUN_STATE_FILE)
+
+
+def is_unchanged(opt, to_update, source_file=None):
+    """
+    Check whether the inputs of the reports are those of the last complete run.
+
+    This does not import mica: only the modification time and size of the guide star
+    table are read, and by default the table is the one used by the last run.
+
+    :param opt: parsed command-line options
+    :param to_update: dict of interval name to interval dict
+    :param source_file: path of the mica guide star table (default: from the last run)
+    :rtype: bool
+    """
+    last = read_run_state(opt.datadir)
+    if opt.force or last is None:
+        return False
+    if source_file is None:
+        source_file = last["source"]["source"]
+    try:
+        return get_run_state(opt, to_update, source_file) == last
+    except OSError:
+        return False
+
+
+def load_changed_guide_stats(opt, to_update, timings, source_file=None):
+    """
+    Load the guide star table, unless nothing changed since the last complete run.
+
+    The state of the run is read before the table is loaded, so that a change during
+    the load is seen by the next run.
+
+    :param opt: parsed command-line options
+    :param to_update: dict of interval name to interval dict
+    :param timings: Timings of the run
+    :param source_file: path of the mica guide star table (default: from the last run
+        to check for changes, and from mica to load it)
+    :returns: GuideStatsTable (None if nothing changed), and the state to write with
+        write_run_state once the reports are updated (None if the table path is unknown)
+    """
+    with timings.stage("unchanged"):
+        unchanged = is_unchanged(opt, to_update, source_file)
+    if unchanged:
+        logger.info("Nothing changed since the last run")
+        return None, None
+
+    if source_file is None:
+        source_file = get_source_file()
+    run_state = None
+    if source_file is not None:
+        run_state = get_run_state(opt, to_update, source_file)
+    return load_guide_stats(opt, timings), run_state
+
+
+def update_reports(table, to_update, opt, timings):
+    """
+    Update the reports of several intervals and the summary store.
+
+    The manifest of each updated interval is written last, after its row of the
+    summary store. An interrupted update (or one that failed in another interval) is
+    then redone on the next run, so the store does not miss any written report.
+
+    :param table: GuideStatsTable of the mission guide stars (from load_guide_stats)
+    :param to_update: dict of interval name to interval dict
+    :param opt: parsed command-line options
+    :param timings: Timings of the run
+    :returns: dict of interval name to report dict, for the intervals that were written,
+        and the summary store array (None if it was not changed)
+    """
+    with timings.stage("intervals", rows=len(to_update)):
+        updated = update_intervals(table, to_update, opt, jobs=opt.jobs)
+
+    summary = None
+    if updated or not (opt.datadir / SUMMARY_FILE).exists():
+        with timings.stage("summary", files=1) as stage:
+            summary = upsert_summary(
+                opt.datadir,
+                {
+                    (str(to_update[tname]["year"]), to_update[tname]["subid"]): rep
+                    for tname, rep in updated.items()
+                },
+            )
+            stage.rows = len(summary)
+
+    config = get_report_config(opt)
+    with timings.stage("manifests", rows=len(updated), files=len(updated)):
+        for tname in updated:
+            trange = to_update[tname]
+            stars = table.get_range(
+                DateTime(trange["start"]).secs, DateTime(trange["stop"]).secs
+            )
+            write_manifest(get_dataout(opt, trange), get_manifest(stars, config))
+    return updated, summary
+
+
+def write_timings(opt, timings, updated):
+    """
+    Write the timings of a run in the data directory.
+
+    :param opt: parsed command-line options
+    :param timings: Timings of the run
+    :param updated: dict of interval name to report dict (from update_reports)
+    """
+    run_timings = {
+        "date": DateTime().date,
+        "stages": timings.as_dict(),
+        "intervals": {tname: rep.get("timings", {}) for tname, rep in updated.items()},
+    }
+    with open(opt.datadir / TIMINGS_FILE, "w") as fh:
+        json.dump(run_timings, fh, indent=4)
+
+
+def main():
+    """
+    Update star statistics plots.
+
+    Mission averages are computed with all stars from 2003:001 to the end of the interval.
+    """
+    opt = get_parser().parse_args()
+
+    logger.setLevel(opt.v.upper())
+
+    if opt.watch:
+        # the pipeline module imports this one
+        from guide_stat_reports.pipeline import watch  # noqa: PLC0415
+
+        watch(opt)
+        return
+
+    timings = Timings(enabled=opt.timings)
+    with timings.stage("run"):
+        with timings.stage("ranges") as stage:
+            to_update = ska_report_ranges.get_update_ranges(opt.days_back)
+            stage.rows = len(to_update)
+        if not to_update:
+            return
+
+        table, run_state = load_changed_guide_stats(opt, to_update, timings)
+        if table is None:
+            return
+        updated, _ = update_reports(table, to_update, opt, timings)
+        if run_state is not None:
+            write_run_state(opt.datadir, run_state)
+
+    if timings.enabled:
+        write_timings(opt, timings, updated)
 
 
 if __name__ == "__main__":
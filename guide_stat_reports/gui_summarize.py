@@ -4,21 +4,25 @@ Write summary page for guide stats.
 """
 
 import argparse
+import hashlib
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import jinja2
-
-# Matplotlib setup
-# Use Agg backend for command-line (non-interactive) operation
-import matplotlib
 import numpy as np
-
-if __name__ == "__main__":
-    matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 from chandra_time import DateTime
 
+from guide_stat_reports import __version__
+from guide_stat_reports.aggregates import FAIL_TYPES
+from guide_stat_reports.predictions import get_fit_start, predict_rate
+from guide_stat_reports.summary_store import (
+    CADENCES,
+    get_cadence,
+    read_summary,
+)
+
 JINJA_ENV = jinja2.Environment(
     loader=jinja2.FileSystemLoader(Path(__file__).parent / "templates" / "guide_stats")
 )
@@ -38,124 +42,320 @@ def get_parser():
         help="Output data directory",
         type=Path,
     )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes used to render the plots (one per failure type)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render all plots even if their input did not change",
+    )
     return parser
 
 
-def main():  # noqa: PLR0915
-    args = get_parser().parse_args()
+SUMMARY_PLOTS_FILE = "summary_plots.json"
+"""
+File in the summary directory with a hash of the input of each plot
+"""
 
-    datadir = args.datadir
-    plotdir = args.webdir / "summary"
-    plotdir.mkdir(exist_ok=True, parents=True)
+SUMMARY_FIGSIZE = (5, 3)
 
-    time_pad = 0.05
+TIME_PAD = 0.05
+"""
+Padding of the time axis after the current time, as a fraction of the time since 2000
+"""
 
-    data = {
-        "month": sorted(datadir.glob("????/M??/rep.json")),
-        "quarter": sorted(datadir.glob("????/Q?/rep.json")),
-        "semi": sorted(datadir.glob("????/S?/rep.json")),
-        "year": sorted(datadir.glob("????/YEAR/rep.json")),
+
+REPORT_DTYPE = [("datestart", "U21"), ("datestop", "U21")] + [
+    (f"{ftype}_{name}", "f8")
+    for ftype in FAIL_TYPES
+    for name in ["rate", "err_h", "err_l"]
+]
+"""
+Fields of the summary arrays returned by load_reports (a subset of those of the
+summary store)
+"""
+
+
+def load_reports(paths):
+    """
+    Load the summary values of several rep.json files into one structured array.
+
+    :param paths: list of rep.json paths
+    :returns: structured array with REPORT_DTYPE and one row per report
+    """
+    reports = np.zeros(len(paths), dtype=REPORT_DTYPE)
+    for ftype in FAIL_TYPES:
+        for name in ["rate", "err_h", "err_l"]:
+            reports[f"{ftype}_{name}"] = np.nan
+    for idx, path in enumerate(paths):
+        with open(path, "r") as rep_file:
+            rep = json.load(rep_file)
+        row = reports[idx]
+        row["datestart"] = rep["datestart"]
+        row["datestop"] = rep["datestop"]
+        for fblock in rep["fail_types"]:
+            row[f"{fblock['type']}_rate"] = fblock["rate"]
+            row[f"{fblock['type']}_err_h"] = fblock["rate_err_high"]
+            row[f"{fblock['type']}_err_l"] = fblock["rate_err_low"]
+    return reports
+
+
+def get_rates(reports):
+    """
+    Get the time series of the rate of each failure type.
+
+    :param reports: structured array from load_reports or the summary store
+    :returns: dict of failure type to dict of time (frac year), rate, err_h and err_l
+    """
+    if len(reports):
+        tstart = DateTime(reports["datestart"]).secs
+        tstop = DateTime(reports["datestop"]).secs
+        times = DateTime((tstart + tstop) / 2).frac_year
+    else:
+        times = np.array([])
+    return {
+        ftype: {
+            "time": times,
+            "rate": reports[f"{ftype}_rate"],
+            "err_h": reports[f"{ftype}_err_h"],
+            "err_l": reports[f"{ftype}_err_l"],
+        }
+        for ftype in FAIL_TYPES
     }
 
-    # figmap = {"bad_trak": 1, "obc_bad": 2, "no_trak": 3}
-    for d, d_paths in data.items():
-        rates = {
-            ftype: {
-                "time": np.array([]),
-                "rate": np.array([]),
-                "err_h": np.array([]),
-                "err_l": np.array([]),
-            }
-            for ftype in ["bad_trak", "no_trak", "obc_bad"]
+
+def get_now_frac():
+    """
+    Get the current time as a fractional year, rounded down to the start of the day.
+
+    The time axis of the plots ends at this time, so the plots only change once a day
+    when the data does not change.
+
+    :rtype: float
+    """
+    return DateTime(DateTime().date[:8]).frac_year
+
+
+def get_series_hash(series, now_frac):
+    """
+    Get a hash of the input of the plots of one time series.
+
+    :param series: dict of time, rate, err_h and err_l arrays
+    :param now_frac: current time (frac year)
+    :rtype: str
+    """
+    hasher = hashlib.sha256(f"{__version__}:{now_frac!r}".encode())
+    for key in sorted(series):
+        arr = np.ascontiguousarray(series[key], dtype=float)
+        hasher.update(f"{key}:{arr.shape}".encode())
+        hasher.update(arr.tobytes())
+    return hasher.hexdigest()
+
+
+def get_plot_names(cadence, ftype):
+    """
+    Get the file names of the plots of a cadence and failure type.
+
+    :returns: rate plot name, rate with error bars plot name
+    """
+    return f"summary_{cadence}_{ftype}.png", f"summary_{cadence}_{ftype}_eb.png"
+
+
+class SummaryPlots:
+    """
+    Rate plots of one failure type, with and without error bars.
+
+    The two figures (axes, grid, trend line, labels) are made once and reused for all
+    cadences. Drawing a cadence only replaces the data artists and updates the y
+    limits and title.
+
+    :param ftype: failure type
+    :param now_frac: current time (frac year)
+    """
+
+    def __init__(self, ftype, now_frac):
+        # matplotlib is slow to import and only needed when a plot is rendered
+        from matplotlib.figure import Figure  # noqa: PLC0415
+
+        self.ftype = ftype
+        self.fig = Figure(figsize=SUMMARY_FIGSIZE)
+        self.ax = self.fig.add_subplot()
+        self.fig_eb = Figure(figsize=SUMMARY_FIGSIZE)
+        self.ax_eb = self.fig_eb.add_subplot()
+
+        self.trend_frac = np.array([get_fit_start(ftype), now_frac + 1])
+        self.trend_rate = predict_rate(ftype, self.trend_frac)
+        dxlim = now_frac - 2000
+        for fig, ax in [(self.fig, self.ax), (self.fig_eb, self.ax_eb)]:
+            ax.grid()
+            # drawn above the data, which is added later
+            ax.plot(self.trend_frac, self.trend_rate, "r-", zorder=2.01)
+            ax.set_xlim(2000, now_frac + TIME_PAD * dxlim)
+            ax.set_ylabel("Rate", fontsize=12)
+            fig.subplots_adjust(left=0.15)
+        self._artists = []
+
+    def draw(self, cadence, series):
+        """
+        Draw the rates of one cadence.
+
+        :param cadence: cadence name (month, quarter, semi or year)
+        :param series: dict of time, rate, err_h and err_l arrays
+        """
+        for artist in self._artists:
+            artist.remove()
+
+        # the y limits of the error bar plot are autoscaled to the new data and the
+        # trend line, as if the figure was new
+        self.ax_eb.ignore_existing_data_limits = True
+        self.ax_eb.update_datalim(np.column_stack([self.trend_frac, self.trend_rate]))
+        self.ax_eb.set_autoscaley_on(True)
+
+        line = self.ax.plot(
+            series["time"],
+            series["rate"],
+            color="black",
+            linestyle="",
+            marker=".",
+            markersize=5,
+        )[0]
+        errorbar = self.ax_eb.errorbar(
+            series["time"],
+            series["rate"],
+            yerr=np.array([series["err_l"], series["err_h"]]),
+            color="black",
+            linestyle="",
+            marker=".",
+            markersize=5,
+        )
+        self._artists = [line, errorbar]
+
+        ylim = self.ax_eb.get_ylim()
+        # pad a bit below 0 relative to ylim range
+        self.ax_eb.set_ylim(ylim[0] - 0.025 * (ylim[1] - ylim[0]))
+        self.ax.set_ylim(self.ax_eb.get_ylim())
+        for ax in [self.ax, self.ax_eb]:
+            for label in ax.get_xticklabels() + ax.get_yticklabels():
+                label.set_size("small")
+            ax.set_title(f"{cadence} {self.ftype}", fontsize=12)
+
+    def savefig(self, cadence, plotdir):
+        """
+        Save the plots of the last cadence drawn.
+
+        :param cadence: cadence name
+        :param plotdir: output directory
+        """
+        name, name_eb = get_plot_names(cadence, self.ftype)
+        self.fig.savefig(plotdir / name)
+        self.fig_eb.savefig(plotdir / name_eb)
+
+
+def render_summary_plots(ftype, rates, now_frac, plotdir):
+    """
+    Render the plots of one failure type for several cadences.
+
+    :param ftype: failure type
+    :param rates: dict of cadence to dict of time, rate, err_h and err_l arrays
+    :param now_frac: current time (frac year)
+    :param plotdir: output directory
+    """
+    plots = SummaryPlots(ftype, now_frac)
+    for cadence, series in rates.items():
+        plots.draw(cadence, series)
+        plots.savefig(cadence, plotdir)
+
+
+def make_summary_plots(data, plotdir, *, jobs=1, force=False):
+    """
+    Make the summary rate plots of each cadence and failure type.
+
+    A hash of the input of each plot is stored in SUMMARY_PLOTS_FILE, and plots whose
+    input did not change since they were last made are not rendered again.
+
+    :param data: dict of cadence to summary array (from get_cadence or load_reports)
+    :param plotdir: output directory
+    :param jobs: number of processes used to render the plots
+    :param force: render all plots even if their input did not change
+    :returns: list of the plots that were rendered
+    """
+    now_frac = get_now_frac()
+    rates = {cadence: get_rates(reports) for cadence, reports in data.items()}
+
+    hashes = {}
+    to_render = {}
+    sidecar = plotdir / SUMMARY_PLOTS_FILE
+    try:
+        old_hashes = json.loads(sidecar.read_text())
+    except (OSError, ValueError):
+        old_hashes = {}
+    for ftype in FAIL_TYPES:
+        for cadence in data:
+            series = rates[cadence][ftype]
+            series_hash = get_series_hash(series, now_frac)
+            names = get_plot_names(cadence, ftype)
+            hashes.update(dict.fromkeys(names, series_hash))
+            if force or any(
+                old_hashes.get(name) != series_hash or not (plotdir / name).exists()
+                for name in names
+            ):
+                to_render.setdefault(ftype, {})[cadence] = series
+
+    if jobs > 1 and len(to_render) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+        ) as pool:
+            futures = [
+                pool.submit(render_summary_plots, ftype, ftype_rates, now_frac, plotdir)
+                for ftype, ftype_rates in to_render.items()
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for ftype, ftype_rates in to_render.items():
+            render_summary_plots(ftype, ftype_rates, now_frac, plotdir)
+
+    sidecar.write_text(json.dumps(hashes, sort_keys=True, indent=4))
+    return [
+        name
+        for ftype, ftype_rates in to_render.items()
+        for cadence in ftype_rates
+        for name in get_plot_names(cadence, ftype)
+    ]
+
+
+def make_summary(webdir, datadir, summary=None, *, jobs=1, force=False):
+    """
+    Write the summary page and its plots.
+
+    :param webdir: output web directory (the page is written in its summary directory)
+    :param datadir: data directory
+    :param summary: summary store array (default: read from datadir, or from the
+        rep.json files if there is no store)
+    :param jobs: number of processes used to render the plots
+    :param force: render all plots even if their input did not change
+    """
+    plotdir = webdir / "summary"
+    plotdir.mkdir(exist_ok=True, parents=True)
+
+    if summary is None:
+        summary = read_summary(datadir)
+    if summary is not None:
+        data = {cadence: get_cadence(summary, cadence) for cadence in CADENCES}
+    else:
+        # no summary store (yet), read the individual reports
+        data = {
+            "month": load_reports(sorted(datadir.glob("????/M??/rep.json"))),
+            "quarter": load_reports(sorted(datadir.glob("????/Q?/rep.json"))),
+            "semi": load_reports(sorted(datadir.glob("????/S?/rep.json"))),
+            "year": load_reports(sorted(datadir.glob("????/YEAR/rep.json"))),
         }
 
-        for p in d_paths:
-            with open(p, "r") as rep_file:
-                rep_text = rep_file.read()
-            rep = json.loads(rep_text)
-            for ftype, ftype_rates in rates.items():
-                datetime = DateTime(
-                    (DateTime(rep["datestart"]).secs + DateTime(rep["datestop"]).secs)
-                    / 2
-                )
-                frac_year = datetime.frac_year
-                ftype_rates["time"] = np.append(ftype_rates["time"], frac_year)
-                for fblock in rep["fail_types"]:
-                    if fblock["type"] == ftype:
-                        ftype_rates["rate"] = np.append(
-                            ftype_rates["rate"], fblock["rate"]
-                        )
-                        ftype_rates["err_h"] = np.append(
-                            ftype_rates["err_h"], fblock["rate_err_high"]
-                        )
-                        ftype_rates["err_l"] = np.append(
-                            ftype_rates["err_l"], fblock["rate_err_low"]
-                        )
-
-        for ftype in [
-            "no_trak",
-            "bad_trak",
-            "obc_bad",
-        ]:
-            fig1 = plt.figure(1, figsize=(5, 3))
-            ax1 = fig1.gca()
-            fig2 = plt.figure(2, figsize=(5, 3))
-            ax2 = fig2.gca()
-
-            ax1.plot(
-                rates[ftype]["time"],
-                rates[ftype]["rate"],
-                color="black",
-                linestyle="",
-                marker=".",
-                markersize=5,
-            )
-            ax1.grid()
-            ax2.errorbar(
-                rates[ftype]["time"],
-                rates[ftype]["rate"],
-                yerr=np.array([rates[ftype]["err_l"], rates[ftype]["err_h"]]),
-                color="black",
-                linestyle="",
-                marker=".",
-                markersize=5,
-            )
-            ax2.grid()
-            fit_data_dir = Path(__file__).parent / "data"
-            with open(fit_data_dir / f"{ftype}_fitfile.json", "r") as fit_file:
-                fit_text = fit_file.read()
-            fit = json.loads(fit_text)
-            trend_start_frac = DateTime(fit["datestart"]).frac_year
-            m = fit["m"]
-            b = fit["b"]
-            now_frac = DateTime().frac_year
-            for ax in [ax1, ax2]:
-                ax.plot(
-                    [trend_start_frac, now_frac + 1],
-                    [b, m * ((now_frac + 1) - trend_start_frac) + b],
-                    "r-",
-                )
-            ax2_ylim = ax2.get_ylim()
-            # pad a bit below 0 relative to ylim range
-            ax2.set_ylim(ax2_ylim[0] - 0.025 * (ax2_ylim[1] - ax2_ylim[0]))
-            ax1.set_ylim(ax2.get_ylim())
-
-            for ax in [ax1, ax2]:
-                dxlim = now_frac - 2000
-                ax.set_xlim(2000, now_frac + time_pad * dxlim)
-                #    ax = fig.get_axes()[0]
-                labels = ax.get_xticklabels() + ax.get_yticklabels()
-                for label in labels:
-                    label.set_size("small")
-                ax.set_ylabel("Rate", fontsize=12)
-                ax.set_title(f"{d} {ftype}", fontsize=12)
-
-            fig1.subplots_adjust(left=0.15)
-            fig2.subplots_adjust(left=0.15)
-            fig1.savefig(plotdir / f"summary_{d}_{ftype}.png")
-            fig2.savefig(plotdir / f"summary_{d}_{ftype}_eb.png")
-            plt.close(fig1)
-            plt.close(fig2)
+    make_summary_plots(data, plotdir, jobs=jobs, force=force)
 
     outfile = plotdir / "guide_summary.html"
     template = JINJA_ENV.get_template("summary.html")
@@ -164,5 +364,10 @@ def main():  # noqa: PLR0915
         fh.write(page)
 
 
+def main():
+    args = get_parser().parse_args()
+    make_summary(args.webdir, args.datadir, jobs=args.jobs, force=args.force)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Update the guide stat reports, table of contents and summary in one process.
+
+The stages run in the order of their dependencies (PIPELINE_STAGES). The reports stage
+passes the intervals it updated and the summary store to the other stages in memory,
+and the table of contents and summary are only rewritten if a report changed. With
+--watch the pipeline runs at each change of the guide star table, which stays in memory.
+"""
+
+import argparse
+import graphlib
+import logging
+import time
+
+import ska_report_ranges
+from chandra_time import DateTime
+
+from guide_stat_reports import gui_summarize, toc
+from guide_stat_reports.gui_stat_reports import (
+    HEARTBEAT_FILE,
+    get_parser,
+    load_changed_guide_stats,
+    update_reports,
+    write_run_state,
+    write_timings,
+)
+from guide_stat_reports.snapshot import get_source_file, get_source_info
+from guide_stat_reports.summary_store import read_summary
+from guide_stat_reports.timings import Timings
+
+logger = logging.getLogger("acq_stat_reports")
+
+
+def get_summary(opt, results):
+    """
+    Get the summary store, from the reports stage or else from the data directory.
+
+    :param opt: parsed command-line options
+    :param results: dict of stage name to stage results
+    :returns: summary store array, or None if there is none
+    """
+    reports = results["reports"]
+    if reports["summary"] is None:
+        reports["summary"] = read_summary(opt.datadir)
+    return reports["summary"]
+
+
+def needs_update(opt, results, path):
+    """
+    Check whether a page that depends on the reports has to be rewritten.
+
+    :param opt: parsed command-line options
+    :param results: dict of stage name to stage results
+    :param path: path of the page
+    :rtype: bool
+    """
+    return opt.force or bool(results["reports"]["updated"]) or not path.exists()
+
+
+def run_ranges(opt, timings, _results):
+    with timings.stage("ranges") as stage:
+        to_update = ska_report_ranges.get_update_ranges(opt.days_back)
+        stage.rows = len(to_update)
+    # the guide star table is found by the table stage
+    return {"to_update": to_update, "source_file": None}
+
+
+def run_table(opt, timings, results):
+    to_update = results["ranges"]["to_update"]
+    if not to_update:
+        return {"table": None, "run_state": None}
+    table, run_state = load_changed_guide_stats(
+        opt, to_update, timings, results["ranges"]["source_file"]
+    )
+    return {"table": table, "run_state": run_state}
+
+
+def run_reports(opt, timings, results):
+    table = results["table"]["table"]
+    if table is None:
+        return {"updated": {}, "summary": None}
+
+    updated, summary = update_reports(
+        table, results["ranges"]["to_update"], opt, timings
+    )
+    if results["table"]["run_state"] is not None:
+        write_run_state(opt.datadir, results["table"]["run_state"])
+    logger.info(f"Updated {len(updated)} intervals")
+    return {"updated": updated, "summary": summary}
+
+
+def run_toc(opt, timings, results):
+    if not needs_update(opt, results, opt.webdir / "index.html"):
+        return {"written": False}
+    summary = get_summary(opt, results)
+    with timings.stage("toc", files=1):
+        toc.make_toc(
+            opt.webdir,
+            None if summary is None else toc.get_summary_intervals(summary),
+        )
+    return {"written": True}
+
+
+def run_summary(opt, timings, results):
+    if not needs_update(opt, results, opt.webdir / "summary" / "guide_summary.html"):
+        return {"written": False}
+    summary = get_summary(opt, results)
+    with timings.stage("gui_summarize"):
+        gui_summarize.make_summary(
+            opt.webdir, opt.datadir, summary, jobs=opt.plot_jobs, force=opt.force
+        )
+    return {"written": True}
+
+
+PIPELINE_STAGES = {
+    "ranges": (run_ranges, []),
+    "table": (run_table, ["ranges"]),
+    "reports": (run_reports, ["ranges", "table"]),
+    "toc": (run_toc, ["reports"]),
+    "summary": (run_summary, ["reports"]),
+}
+"""
+Stages of the pipeline: stage name to (function, names of the stages it depends on).
+Each function is called with the command-line options, the Timings of the run and the
+results of the stages that already ran, and returns a dict of its own results.
+"""
+
+
+def run_pipeline(opt, timings, results=None):
+    """
+    Run the pipeline stages in the order of their dependencies.
+
+    :param opt: parsed command-line options
+    :param timings: Timings of the run
+    :param results: dict of stage name to the results of stages that are not run
+        (e.g. the table kept in memory by --watch)
+    :returns: dict of stage name to stage results
+    """
+    graph = {name: deps for name, (_, deps) in PIPELINE_STAGES.items()}
+    results = dict(results or {})
+    for name in graphlib.TopologicalSorter(graph).static_order():
+        if name not in results:
+            func, _ = PIPELINE_STAGES[name]
+            results[name] = func(opt, timings, results)
+    return results
+
+
+def write_heartbeat(path):
+    """
+    Write the heartbeat file (the current date).
+
+    :param path: heartbeat file
+    """
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text(f"{DateTime().date}\n")
+
+
+def watch(opt):
+    """
+    Keep the reports, table of contents and summary up to date.
+
+    The guide star table, compiled templates and imported modules stay in memory
+    between updates. At each poll the heartbeat file is rewritten, and the pipeline is
+    run if the mica guide star table changed (its modification time or size) or if the
+    intervals to update changed. The table stage only runs if the table changed, and
+    the other stages only rewrite what changed, as in a single run: the reports of the
+    intervals whose stars were added, removed or reprocessed (see get_fingerprint),
+    then the table of contents and summary if a report was.
+
+    :param opt: parsed command-line options
+    """
+    heartbeat = opt.heartbeat or opt.datadir / HEARTBEAT_FILE
+    source_file = get_source_file()
+    if source_file is None:
+        logger.warning("Unknown guide star table path, reloading it at each poll")
+
+    logger.info(f"Watching the guide star table every {opt.poll_interval} s")
+    try:
+        _watch(opt, heartbeat, source_file)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+
+def _watch(opt, heartbeat, source_file):
+    table = None
+    source_info = None
+    interval_names = None
+    while True:
+        write_heartbeat(heartbeat)
+        try:
+            to_update = ska_report_ranges.get_update_ranges(opt.days_back)
+            # read before loading, so a change during the load is seen at the next poll
+            new_info = None if source_file is None else get_source_info(source_file)
+            changed = source_info is None or new_info is None or new_info != source_info
+            # a change of a table that was already seen, as opposed to a first load
+            modified = source_info is not None and new_info not in (None, source_info)
+            if changed or sorted(to_update) != interval_names:
+                known = {"ranges": {"to_update": to_update, "source_file": source_file}}
+                # without a table, the table stage loads it if anything changed since
+                # the last run
+                if not changed and table is not None:
+                    known["table"] = {"table": table, "run_state": None}
+                timings = Timings(enabled=opt.timings)
+                with timings.stage("run"):
+                    results = run_pipeline(opt, timings, known)
+                table = results["table"]["table"]
+                source_info = new_info
+                interval_names = sorted(to_update)
+                if modified and not results["reports"]["updated"]:
+                    logger.warning(
+                        "The guide star table changed but no report did, the changed "
+                        f"stars are outside the intervals of the last {opt.days_back} "
+                        "days"
+                    )
+                if timings.enabled:
+                    write_timings(opt, timings, results["reports"]["updated"])
+                # --force only applies to the first update
+                opt = argparse.Namespace(**{**vars(opt), "force": False})
+                write_heartbeat(heartbeat)
+        except Exception:
+            # keep watching, the error is in the log and the update is retried
+            logger.exception("ERROR: update failed")
+            source_info = None
+        time.sleep(opt.poll_interval)
+
+
+def main():
+    parser = get_parser()
+    parser.description = __doc__
+    opt = parser.parse_args()
+
+    logger.setLevel(opt.v.upper())
+
+    if opt.watch:
+        watch(opt)
+        return
+
+    timings = Timings(enabled=opt.timings)
+    with timings.stage("run"):
+        results = run_pipeline(opt, timings)
+
+    if timings.enabled:
+        write_timings(opt, timings, results["reports"]["updated"])
+
+
+if __name__ == "__main__":
+    main()
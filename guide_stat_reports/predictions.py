@@ -0,0 +1,76 @@
+"""
+Predicted failure rates from the trend fits in the data directory.
+"""
+
+import functools
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+from chandra_time import DateTime
+
+FIT_DATA_DIR = Path(__file__).parent / "data"
+
+OLD_PRED = {"obc_bad": 0.07, "bad_trak": 0.005, "no_trak": 0.001}
+"""
+Predicted rate of each failure type before the start of its trend fit
+"""
+
+
+@functools.cache
+def get_fit(ftype):
+    """
+    Get the trend fit of a failure type (the contents of its fit file).
+
+    :param ftype: failure type (bad_trak, no_trak or obc_bad)
+    :rtype: dict
+    """
+    with open(FIT_DATA_DIR / f"{ftype}_fitfile.json", "r") as fh:
+        return json.load(fh)
+
+
+@functools.cache
+def get_fit_start(ftype):
+    """
+    Get the start of the trend fit of a failure type.
+
+    :param ftype: failure type (bad_trak, no_trak or obc_bad)
+    :returns: fit start as a fractional year
+    """
+    return DateTime(get_fit(ftype)["datestart"]).frac_year
+
+
+@functools.cache
+def get_fit_file_hashes():
+    """
+    Get the SHA-256 hash of each prediction fit file.
+
+    :rtype: dict of fit file name to hex digest
+    """
+    return {
+        path.name: hashlib.sha256(path.read_bytes()).hexdigest()
+        for path in sorted(FIT_DATA_DIR.glob("*_fitfile.json"))
+    }
+
+
+def predict_rate(ftype, frac_years):
+    """
+    Get the predicted rate of a failure type.
+
+    The rate follows the linear trend fit from the start of the fit, and is OLD_PRED
+    before that.
+
+    :param ftype: failure type (bad_trak, no_trak or obc_bad)
+    :param frac_years: time(s) as fractional years
+    :returns: predicted rate(s), a float for a scalar time
+    """
+    fit = get_fit(ftype)
+    fit_start = get_fit_start(ftype)
+    frac_years = np.asarray(frac_years, dtype=float)
+    rates = np.where(
+        frac_years >= fit_start,
+        fit["m"] * (frac_years - fit_start) + fit["b"],
+        OLD_PRED[ftype],
+    )
+    return float(rates) if rates.ndim == 0 else rates
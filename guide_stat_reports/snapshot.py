@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+"""
+Refresh or verify the local snapshot of the guide star table.
+
+The snapshot is a copy of the columns of the mica guide star table that are used by the
+reports (one ``.npy`` file per column, sorted by kalman_tstart) in
+``<datadir>/snapshot``. It is loaded memory-mapped, so repeated runs read it from the
+OS page cache instead of decoding the mica HDF5 file again. The snapshot records the
+modification time and size of the mica file, and it is rebuilt when these change or
+when one of its column files is missing or truncated.
+
+``<datadir>/snapshot`` is a symbolic link to the directory of the current snapshot. A
+new snapshot is written in a new directory and the link is then replaced atomically,
+so that processes reading the snapshot at the same time see either the old or the new
+one, never a mix. Processes that update the snapshot take a lock file first.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.table import STAR_COLUMNS, GuideStatsTable, StarTable
+
+logger = logging.getLogger("acq_stat_reports")
+
+SNAPSHOT_DIR = "snapshot"
+"""
+Name of the snapshot directory in the data directory
+"""
+
+SNAPSHOT_META = "meta.json"
+"""
+Name of the file with the snapshot source information. It is written last, so a
+snapshot without it is incomplete.
+"""
+
+SNAPSHOT_LOCK = "snapshot.lock"
+"""
+Name of the lock file, in the data directory, held while the snapshot is updated
+"""
+
+
+def get_source_file():
+    """
+    Get the path of the mica guide star table.
+
+    :returns: Path, or None if mica does not expose it
+    """
+    # mica is slow to import and the report entry point imports this module
+    import mica.stats.guide_stats  # noqa: PLC0415
+
+    path = getattr(mica.stats.guide_stats, "TABLE_FILE", None)
+    return None if path is None else Path(path)
+
+
+def get_source_info(source_file):
+    """
+    Get the information used to tell whether the source table changed.
+
+    :param source_file: path of the mica guide star table
+    :rtype: dict with source, mtime and size
+    """
+    stat = os.stat(source_file)
+    return {"source": str(source_file), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def read_meta(snapdir):
+    """
+    Read the snapshot source information.
+
+    :param snapdir: snapshot directory
+    :returns: dict, or None if there is no (complete) snapshot
+    """
+    try:
+        return json.loads((snapdir / SNAPSHOT_META).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def read_snapshot(snapdir, mmap_mode="r"):
+    """
+    Read the snapshot columns.
+
+    :param snapdir: snapshot directory
+    :param mmap_mode: mmap_mode of np.load (None to read the columns into memory)
+    :returns: StarTable, or None if there is no complete snapshot
+    """
+    # all files are read from the same snapshot, even if it is replaced meanwhile
+    snapdir = snapdir.resolve()
+    meta = read_meta(snapdir)
+    if meta is None:
+        return None
+    try:
+        columns = {
+            name: np.load(snapdir / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in meta["columns"]
+        }
+    except (OSError, ValueError):
+        return None
+    return StarTable(columns)
+
+
+@contextlib.contextmanager
+def snapshot_lock(snapdir):
+    """
+    Hold the lock of the snapshot updates (blocking until it is free).
+
+    :param snapdir: snapshot directory
+    """
+    snapdir.parent.mkdir(exist_ok=True, parents=True)
+    with open(snapdir.parent / SNAPSHOT_LOCK, "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def write_snapshot(snapdir, table, source_info):
+    """
+    Write the snapshot of a table.
+
+    The snapshot is written in a new directory, and snapdir (a symbolic link) is then
+    replaced atomically to point to it. The previous snapshots are removed, and
+    processes that have their columns mapped keep a consistent view of them. Call this
+    with the snapshot_lock held.
+
+    :param snapdir: snapshot directory
+    :param table: GuideStatsTable
+    :param source_info: source information (from get_source_info)
+    """
+    snapdir.parent.mkdir(exist_ok=True, parents=True)
+    newdir = Path(tempfile.mkdtemp(prefix=f"{snapdir.name}-", dir=snapdir.parent))
+    newdir.chmod(0o755)
+    stars = table.stars
+    for name in stars.colnames:
+        np.save(newdir / f"{name}.npy", stars[name])
+    meta = {
+        **source_info,
+        "columns": {name: stars[name].dtype.str for name in stars.colnames},
+        "n_stars": len(stars),
+        "created": DateTime().date,
+    }
+    (newdir / SNAPSHOT_META).write_text(json.dumps(meta, indent=4))
+
+    # snapshots used to be written directly in snapdir
+    if snapdir.is_dir() and not snapdir.is_symlink():
+        shutil.rmtree(snapdir)
+    link = snapdir.parent / f".{snapdir.name}.link"
+    link.unlink(missing_ok=True)
+    link.symlink_to(newdir.name)
+    os.replace(link, snapdir)
+
+    for olddir in snapdir.parent.glob(f"{snapdir.name}-*"):
+        if olddir != newdir:
+            shutil.rmtree(olddir, ignore_errors=True)
+
+
+def refresh_snapshot(snapdir, source_file=None, force=False):
+    """
+    Rebuild the snapshot if the source table changed (or if there is none).
+
+    :param snapdir: snapshot directory
+    :param source_file: path of the mica guide star table (default from mica)
+    :param force: rebuild even if the source did not change
+    :returns: True if the snapshot was rebuilt
+    """
+    if source_file is None:
+        source_file = get_source_file()
+    if source_file is None:
+        raise ValueError("mica does not give the guide star table path")
+    source_info = get_source_info(source_file)
+    if not force and is_current(snapdir, source_info):
+        return False
+    with snapshot_lock(snapdir):
+        # another process may have updated the snapshot while this one waited
+        if not force and is_current(snapdir, source_info):
+            return False
+        logger.info(f"Updating guide star snapshot in {snapdir}")
+        write_snapshot(snapdir, GuideStatsTable.load(), source_info)
+    return True
+
+
+def get_column_problems(snapdir, meta):
+    """
+    Check that the column files of a snapshot are complete.
+
+    Only the headers of the files are read.
+
+    :param snapdir: snapshot directory
+    :param meta: snapshot source information (from read_meta)
+    :returns: list of problems (empty if the columns are good)
+    """
+    problems = []
+    for name, dtype in meta["columns"].items():
+        try:
+            column = np.load(snapdir / f"{name}.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            problems.append(f"{name} is missing or truncated")
+            continue
+        if column.dtype.str != dtype:
+            problems.append(f"{name} has dtype {column.dtype.str}, not {dtype}")
+        if len(column) != meta["n_stars"]:
+            problems.append(f"{name} has {len(column)} rows, not {meta['n_stars']}")
+    return problems
+
+
+def is_current(snapdir, source_info):
+    """
+    Check whether a snapshot is complete and made from the current source table.
+
+    :param snapdir: snapshot directory
+    :param source_info: current source information (from get_source_info)
+    :rtype: bool
+    """
+    snapdir = snapdir.resolve()
+    meta = read_meta(snapdir)
+    if meta is None:
+        return False
+    columns = {name: np.dtype(dtype).str for name, dtype in STAR_COLUMNS.items()}
+    return (
+        meta["source"] == source_info["source"]
+        and meta["mtime"] == source_info["mtime"]
+        and meta["size"] == source_info["size"]
+        and meta["columns"] == columns
+        and not get_column_problems(snapdir, meta)
+    )
+
+
+def verify_snapshot(snapdir, source_file=None):
+    """
+    Check the snapshot against the source table and for internal consistency.
+
+    :param snapdir: snapshot directory
+    :param source_file: path of the mica guide star table (default from mica)
+    :returns: list of problems (empty if the snapshot is good)
+    """
+    snapdir = snapdir.resolve()
+    meta = read_meta(snapdir)
+    if meta is None:
+        return [f"no complete snapshot in {snapdir}"]
+    problems = get_column_problems(snapdir, meta)
+    if problems:
+        return problems
+    if source_file is None:
+        source_file = get_source_file()
+    if source_file is None:
+        problems.append("mica does not give the guide star table path")
+    elif not is_current(snapdir, get_source_info(source_file)):
+        problems.append(f"snapshot is out of date with {source_file}")
+
+    if not problems:
+        tstart = read_snapshot(snapdir)["kalman_tstart"]
+        if np.any(tstart[1:] < tstart[:-1]):
+            problems.append("stars are not sorted by kalman_tstart")
+    return problems
+
+
+def load_table(snapdir, source_file=None):
+    """
+    Load the guide star table from the snapshot, updating it first if needed.
+
+    If mica does not give the path of its table, the snapshot cannot be checked and the
+    table is loaded from mica.
+
+    :param snapdir: snapshot directory
+    :param source_file: path of the mica guide star table (default from mica)
+    :rtype: GuideStatsTable
+    """
+    if source_file is None:
+        source_file = get_source_file()
+    if source_file is None:
+        logger.warning("Unknown guide star table path, not using the snapshot")
+        return GuideStatsTable.load()
+    refresh_snapshot(snapdir, source_file)
+    t0 = time.perf_counter()
+    stars = read_snapshot(snapdir)
+    if stars is None:
+        # e.g. removed by another process between the refresh and the read
+        logger.warning(f"Unable to read the snapshot in {snapdir}, loading from mica")
+        return GuideStatsTable.load()
+    table = GuideStatsTable(stars)
+    logger.info(
+        f"Mapped {len(table)} guide stars from {snapdir}"
+        f" in {time.perf_counter() - t0:.2f} s"
+    )
+    return table
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--datadir",
+        default="./dataout",
+        help="Output data directory (the snapshot is in its snapshot subdirectory)",
+        type=Path,
+    )
+    parser.add_argument(
+        "--source",
+        help="Path of the mica guide star table (default from mica)",
+        type=Path,
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Only verify the snapshot (exit status 1 if it is not good)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild the snapshot even if the source table did not change",
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    snapdir = args.datadir / SNAPSHOT_DIR
+
+    if args.verify:
+        problems = verify_snapshot(snapdir, args.source)
+        for problem in problems:
+            print(f"ERROR: {problem}")
+        if problems:
+            raise SystemExit(1)
+        print(f"Snapshot in {snapdir} is good")
+        return
+
+    if refresh_snapshot(snapdir, args.source, force=args.force):
+        print(f"Updated snapshot in {snapdir}")
+    else:
+        print(f"Snapshot in {snapdir} is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Columnar store of the summary values of all report intervals.
+
+The store is a single structured array in ``<datadir>/summary.npy`` with one row per
+report interval. It is updated by guide-stat-reports as intervals are written, so the
+summary and table-of-contents stages can read one file instead of every rep.json.
+"""
+
+import json
+import os
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.aggregates import FAIL_TYPES
+
+SUMMARY_FILE = "summary.npy"
+
+SUMMARY_DTYPE = [
+    ("tname", "U16"),
+    ("year", "U4"),
+    ("subid", "U4"),
+    ("tstart", "f8"),
+    ("tstop", "f8"),
+    ("datestart", "U21"),
+    ("datestop", "U21"),
+    ("n_stars", "i8"),
+] + [
+    (f"{ftype}_{name}", dtype)
+    for ftype in FAIL_TYPES
+    for name, dtype in [
+        ("n_stars", "i8"),
+        ("rate", "f8"),
+        ("err_h", "f8"),
+        ("err_l", "f8"),
+        ("n_stars_pred", "f8"),
+        ("rate_pred", "f8"),
+        ("p_less", "f8"),
+        ("p_more", "f8"),
+    ]
+]
+"""
+Fields of the summary store
+"""
+
+CADENCES = {"month": "M", "quarter": "Q", "semi": "S", "year": "YEAR"}
+"""
+Prefix of the interval subid of each report cadence
+"""
+
+
+def get_summary_records(reps):
+    """
+    Get the summary rows of several reports.
+
+    :param reps: dict of (year, subid) to report dict (as written to rep.json)
+    :returns: structured array with SUMMARY_DTYPE
+    """
+    records = np.zeros(len(reps), dtype=SUMMARY_DTYPE)
+    for row, ((year, subid), rep) in zip(records, reps.items(), strict=True):
+        row["tname"] = rep["datestring"]
+        row["year"] = year
+        row["subid"] = subid
+        row["datestart"] = rep["datestart"]
+        row["datestop"] = rep["datestop"]
+        row["n_stars"] = rep["n_stars"]
+        for fblock in rep["fail_types"]:
+            ftype = fblock["type"]
+            row[f"{ftype}_n_stars"] = fblock["n_stars"]
+            row[f"{ftype}_rate"] = fblock["rate"]
+            row[f"{ftype}_err_h"] = fblock["rate_err_high"]
+            row[f"{ftype}_err_l"] = fblock["rate_err_low"]
+            for name in ["n_stars_pred", "rate_pred", "p_less", "p_more"]:
+                row[f"{ftype}_{name}"] = fblock[name]
+    if len(records):
+        records["tstart"] = DateTime(records["datestart"]).secs
+        records["tstop"] = DateTime(records["datestop"]).secs
+    return records
+
+
+def read_summary(datadir):
+    """
+    Read the summary store.
+
+    :param datadir: top level data directory
+    :returns: structured array with SUMMARY_DTYPE, or None if there is no store
+    """
+    path = datadir / SUMMARY_FILE
+    if not path.exists():
+        return None
+    return np.load(path)
+
+
+def write_summary(datadir, summary):
+    """
+    Write the summary store.
+
+    The file is replaced atomically, so readers never see a partially written store.
+
+    :param datadir: top level data directory
+    :param summary: structured array with SUMMARY_DTYPE
+    """
+    summary = summary[np.lexsort([summary["subid"], summary["tstart"]])]
+    datadir.mkdir(exist_ok=True, parents=True)
+    tmp = datadir / f".{SUMMARY_FILE}.tmp"
+    with open(tmp, "wb") as fh:
+        np.save(fh, summary)
+    os.replace(tmp, datadir / SUMMARY_FILE)
+
+
+def upsert_summary(datadir, reps):
+    """
+    Insert or replace the summary rows of some reports in the store.
+
+    If there is no store yet, it is first built from all the rep.json files.
+
+    :param datadir: top level data directory
+    :param reps: dict of (year, subid) to report dict
+    :returns: updated store
+    """
+    summary = read_summary(datadir)
+    if summary is None:
+        summary = rebuild_summary(datadir)
+    records = get_summary_records(reps)
+    keep = ~np.isin(summary["tname"], records["tname"])
+    summary = np.concatenate([summary[keep], records])
+    write_summary(datadir, summary)
+    return summary
+
+
+def rebuild_summary(datadir):
+    """
+    Build the summary store from all the rep.json files in datadir.
+
+    :param datadir: top level data directory
+    :returns: structured array with SUMMARY_DTYPE
+    """
+    reps = {}
+    for path in sorted(datadir.glob("????/*/rep.json")):
+        with open(path, "r") as fh:
+            reps[(path.parent.parent.name, path.parent.name)] = json.load(fh)
+    summary = get_summary_records(reps)
+    write_summary(datadir, summary)
+    return summary
+
+
+def get_cadence(summary, cadence):
+    """
+    Get the rows of one report cadence, in time order.
+
+    :param summary: summary store
+    :param cadence: one of CADENCES
+    :returns: structured array
+    """
+    prefix = CADENCES[cadence]
+    return summary[np.char.startswith(summary["subid"], prefix)]
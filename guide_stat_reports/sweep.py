@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+Sweep the bad_trak and obc_bad thresholds over magnitude bins and report intervals.
+
+For each interval and magnitude bin, the failure counts and rates are computed for a
+whole grid of thresholds at once. The values compared with the thresholds are sorted
+once per interval (by magnitude bin, then value), and the number of stars above each
+threshold is found with a binary search.
+"""
+
+import argparse
+import csv
+import sys
+from pathlib import Path
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.aggregates import get_mag_bin_index, get_mag_bins
+from guide_stat_reports.gui_stat_reports import MAG_BINS
+from guide_stat_reports.snapshot import SNAPSHOT_DIR, load_table
+from guide_stat_reports.summary_store import CADENCES, get_cadence, read_summary
+from guide_stat_reports.table import GuideStatsTable, time_slice
+
+SWEEP_TYPES = ["bad_trak", "obc_bad"]
+"""
+Failure types that depend on a threshold
+"""
+
+
+def get_sweep_values(stars, ftype):
+    """
+    Get the values that are compared with the threshold of a failure type.
+
+    A star is a failure if its value is above the threshold, as in get_fail_masks.
+
+    :param stars: guide stars
+    :param ftype: failure type (one of SWEEP_TYPES)
+    :returns: array of values
+    """
+    if ftype == "bad_trak":
+        return 1.0 - stars["f_track"]
+    return stars["f_obc_bad"]
+
+
+def get_threshold_counts(values, mag_idx, n_bins, thresholds):
+    """
+    Count, in each magnitude bin, the values above each threshold.
+
+    :param values: values compared with the thresholds
+    :param mag_idx: magnitude bin index of each value (from get_mag_bin_index)
+    :param n_bins: number of magnitude bins
+    :param thresholds: array of thresholds
+    :returns: array of counts with shape (n_bins, len(thresholds))
+    """
+    in_bins = (mag_idx >= 0) & (mag_idx < n_bins)
+    values = values[in_bins]
+    mag_idx = mag_idx[in_bins]
+    order = np.lexsort([values, mag_idx])
+    values = values[order]
+    bin_start = np.searchsorted(mag_idx[order], np.arange(n_bins + 1))
+
+    counts = np.zeros((n_bins, len(thresholds)), dtype=int)
+    for ibin in range(n_bins):
+        bin_values = values[bin_start[ibin] : bin_start[ibin + 1]]
+        # NaN values sort last and are never above a threshold
+        n_valid = np.searchsorted(bin_values, np.inf, side="right")
+        counts[ibin] = n_valid - np.searchsorted(bin_values, thresholds, side="right")
+    return counts
+
+
+def sweep_thresholds(stars, thresholds, mag_bins, intervals=None):
+    """
+    Get the failure counts and rates for a grid of thresholds.
+
+    :param stars: guide stars sorted by kalman_tstart (e.g. GuideStatsTable.stars)
+    :param thresholds: dict of failure type (in SWEEP_TYPES) to array of thresholds
+    :param mag_bins: magnitude bin edges
+    :param intervals: list of (tstart, tstop) in Chandra secs (default: all stars)
+    :returns: dict with tstart, tstop, mag_bins, {ftype}_thresholds, n_stars (shape
+        n_intervals x n_bins), and {ftype}_n_stars and {ftype}_rate (shape
+        n_intervals x n_bins x n_thresholds)
+    """
+    if intervals is None:
+        intervals = [(-np.inf, np.inf)]
+    mag_bins = np.asarray(mag_bins, dtype=float)
+    n_bins = len(mag_bins) - 1
+    thresholds = {
+        ftype: np.asarray(thresholds[ftype], dtype=float) for ftype in thresholds
+    }
+
+    sweep = {
+        "tstart": np.array([tstart for tstart, _ in intervals], dtype=float),
+        "tstop": np.array([tstop for _, tstop in intervals], dtype=float),
+        "mag_bins": mag_bins,
+        "n_stars": np.zeros((len(intervals), n_bins), dtype=int),
+    }
+    for ftype, ftype_thresholds in thresholds.items():
+        sweep[f"{ftype}_thresholds"] = ftype_thresholds
+        sweep[f"{ftype}_n_stars"] = np.zeros(
+            (len(intervals), n_bins, len(ftype_thresholds)), dtype=int
+        )
+
+    for idx, (tstart, tstop) in enumerate(intervals):
+        range_stars = time_slice(stars, tstart, tstop)
+        mag_idx = get_mag_bin_index(range_stars, mag_bins)
+        sweep["n_stars"][idx] = np.bincount(
+            mag_idx[(mag_idx >= 0) & (mag_idx < n_bins)], minlength=n_bins
+        )
+        for ftype, ftype_thresholds in thresholds.items():
+            sweep[f"{ftype}_n_stars"][idx] = get_threshold_counts(
+                get_sweep_values(range_stars, ftype), mag_idx, n_bins, ftype_thresholds
+            )
+
+    # empty bins have a rate of 0, as in the reports
+    n_stars = np.maximum(sweep["n_stars"], 1)[:, :, np.newaxis]
+    for ftype in thresholds:
+        sweep[f"{ftype}_rate"] = sweep[f"{ftype}_n_stars"] / n_stars
+    return sweep
+
+
+def get_sweep_rows(sweep, names=None):
+    """
+    Get the rows of a table of the sweep results.
+
+    :param sweep: dict from sweep_thresholds
+    :param names: list of interval names (default: the interval start dates)
+    :returns: iterator of dicts
+    """
+    if names is None:
+        names = [
+            "all" if not np.isfinite(tstart) else DateTime(tstart).date[:8]
+            for tstart in sweep["tstart"]
+        ]
+    mag_bins = sweep["mag_bins"]
+    ftypes = [ftype for ftype in SWEEP_TYPES if f"{ftype}_thresholds" in sweep]
+    for idx, name in enumerate(names):
+        for ibin in range(len(mag_bins) - 1):
+            for ftype in ftypes:
+                for ithresh, thresh in enumerate(sweep[f"{ftype}_thresholds"]):
+                    yield {
+                        "interval": name,
+                        "mag_start": round(float(mag_bins[ibin]), 6),
+                        "mag_stop": round(float(mag_bins[ibin + 1]), 6),
+                        "n_stars": int(sweep["n_stars"][idx, ibin]),
+                        "type": ftype,
+                        "thresh": float(thresh),
+                        "n_fail": int(sweep[f"{ftype}_n_stars"][idx, ibin, ithresh]),
+                        "rate": float(sweep[f"{ftype}_rate"][idx, ibin, ithresh]),
+                    }
+
+
+def parse_thresholds(text):
+    """
+    Parse a list of thresholds.
+
+    :param text: comma-separated values, or start:stop:step (stop included)
+    :returns: array of thresholds
+    """
+    if ":" in text:
+        start, stop, step = (float(val) for val in text.split(":"))
+        return np.round(np.arange(start, stop + step / 2, step), 10)
+    return np.array([float(val) for val in text.split(",")])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--datadir",
+        default="./dataout",
+        help="Data directory, with the summary store (for --cadence) and snapshot",
+        type=Path,
+    )
+    parser.add_argument(
+        "--cadence",
+        choices=["all", *CADENCES],
+        default="all",
+        help="Report intervals to sweep (from the summary store), "
+        "or all to use all stars as one interval",
+    )
+    parser.add_argument("--start", help="Start date of the stars or intervals")
+    parser.add_argument("--stop", help="Stop date of the stars or intervals")
+    parser.add_argument(
+        "--bad_thresholds",
+        default="0.01:0.5:0.01",
+        help="bad_trak thresholds (comma-separated or start:stop:step)",
+    )
+    parser.add_argument(
+        "--obc_bad_thresholds",
+        default="0.01:0.5:0.01",
+        help="obc_bad thresholds (comma-separated or start:stop:step)",
+    )
+    parser.add_argument("--mag_bin_start", default=MAG_BINS[0], type=float)
+    parser.add_argument("--mag_bin_stop", default=MAG_BINS[-1], type=float)
+    parser.add_argument("--mag_bin_width", default=0.1, type=float)
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Load the guide stars from the snapshot in the data directory",
+    )
+    parser.add_argument(
+        "--out",
+        help="Output CSV file (default: standard output)",
+        type=Path,
+    )
+    return parser
+
+
+def get_intervals(opt):
+    """
+    Get the intervals of the sweep from the command-line options.
+
+    :param opt: parsed command-line options
+    :returns: list of (tstart, tstop), list of names
+    """
+    tstart = -np.inf if opt.start is None else DateTime(opt.start).secs
+    tstop = np.inf if opt.stop is None else DateTime(opt.stop).secs
+    if opt.cadence == "all":
+        return [(tstart, tstop)], ["all"]
+    summary = read_summary(opt.datadir)
+    if summary is None:
+        raise ValueError(f"no summary store in {opt.datadir} for --cadence")
+    rows = get_cadence(summary, opt.cadence)
+    rows = rows[(rows["tstart"] >= tstart) & (rows["tstop"] <= tstop)]
+    return list(zip(rows["tstart"], rows["tstop"], strict=True)), list(rows["tname"])
+
+
+def main():
+    opt = get_parser().parse_args()
+
+    intervals, names = get_intervals(opt)
+    mag_bins = get_mag_bins(opt.mag_bin_start, opt.mag_bin_stop, opt.mag_bin_width)
+    thresholds = {
+        "bad_trak": parse_thresholds(opt.bad_thresholds),
+        "obc_bad": parse_thresholds(opt.obc_bad_thresholds),
+    }
+
+    if opt.snapshot:
+        table = load_table(opt.datadir / SNAPSHOT_DIR)
+    else:
+        table = GuideStatsTable.load()
+    sweep = sweep_thresholds(table.stars, thresholds, mag_bins, intervals)
+
+    fieldnames = [
+        "interval",
+        "mag_start",
+        "mag_stop",
+        "n_stars",
+        "type",
+        "thresh",
+        "n_fail",
+        "rate",
+    ]
+    fh = sys.stdout if opt.out is None else open(opt.out, "w", newline="")
+    try:
+        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(get_sweep_rows(sweep, names))
+    finally:
+        if opt.out is not None:
+            fh.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Run-scoped access to the mission guide star statistics table.
+"""
+
+import hashlib
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger("acq_stat_reports")
+
+STAR_COLUMNS = {
+    "kalman_tstart": "f8",
+    "obsid": "i4",
+    "agasc_id": "i4",
+    "f_track": "f8",
+    "f_obc_bad": "f8",
+    "mag_aca": "f4",
+    "aoacmag_mean": "f4",
+    "color": "f4",
+}
+"""
+Columns of the guide star statistics used by the reports, and the dtype in which they
+are kept. The track and OBC bad fractions stay 64-bit so that comparisons with the
+thresholds give exactly the same result as with the original table.
+"""
+
+
+def is_time_sorted(stars):
+    """
+    Check whether stars are sorted by kalman_tstart.
+
+    :param stars: structured array of guide star statistics
+    :rtype: bool
+    """
+    tstart = stars["kalman_tstart"]
+    return bool(np.all(tstart[1:] >= tstart[:-1]))
+
+
+def get_fingerprint(stars):
+    """
+    Get a fingerprint of the guide stars in a range.
+
+    This changes when stars are added to or removed from the range, and when the values
+    of its stars change (e.g. when mica reprocesses them). The digest is a SHA-256 hash
+    of the STAR_COLUMNS of the stars, which takes about a millisecond for a year of
+    stars.
+
+    :param stars: guide stars in the time range, sorted by kalman_tstart
+    :rtype: dict with n_stars, max_kalman_tstart and digest
+    """
+    digest = hashlib.sha256()
+    for name, dtype in STAR_COLUMNS.items():
+        digest.update(np.ascontiguousarray(stars[name], dtype=dtype))
+    return {
+        "n_stars": len(stars),
+        "max_kalman_tstart": (
+            float(stars["kalman_tstart"][-1]) if len(stars) else None
+        ),
+        "digest": digest.hexdigest(),
+    }
+
+
+def time_slice(stars, tstart, tstop):
+    """
+    Get the stars with tstart <= kalman_tstart < tstop from a time-sorted table.
+
+    The range is found with a binary search on kalman_tstart, so this is O(log N) and
+    the result is a view into ``stars`` rather than a copy.
+
+    :param stars: structured array of guide star statistics, sorted by kalman_tstart
+    :param tstart: range start (Chandra secs)
+    :param tstop: range stop (Chandra secs)
+    :rtype: view of the stars in the range
+    """
+    i0, i1 = np.searchsorted(stars["kalman_tstart"], [tstart, tstop], side="left")
+    return stars[i0:i1]
+
+
+class StarTable:
+    """
+    Guide stars stored as one contiguous array per column.
+
+    This supports the subset of the structured array interface used by the reports:
+    ``len``, ``table[colname]`` gives a column, and indexing with a slice, an index
+    array or a boolean mask gives a StarTable of those rows (views for a slice).
+
+    :param columns: dict of column name to 1-d array (all of the same length)
+    :param meta: dict of table information, shared with the row subsets of the table
+    """
+
+    def __init__(self, columns, meta=None):
+        self.columns = columns
+        self.meta = {} if meta is None else meta
+
+    @classmethod
+    def from_stars(cls, stars, columns=None):
+        """
+        Make a table with some of the columns of a table of guide star statistics.
+
+        :param stars: structured array (or table) of guide star statistics
+        :param columns: dict of column name to dtype (default STAR_COLUMNS)
+        :rtype: StarTable
+        """
+        if columns is None:
+            columns = STAR_COLUMNS
+        return cls(
+            {
+                name: np.ascontiguousarray(stars[name], dtype=dtype)
+                for name, dtype in columns.items()
+            }
+        )
+
+    @property
+    def colnames(self):
+        return list(self.columns)
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns.values())
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self.columns[item]
+        return StarTable(
+            {name: col[item] for name, col in self.columns.items()}, self.meta
+        )
+
+
+class GuideStatsTable:
+    """
+    Mission guide star table, loaded once per run.
+
+    Only the columns used by the reports (STAR_COLUMNS) are kept, in a StarTable.
+
+    The table is kept sorted by ``kalman_tstart`` so that the stars in any time range
+    are a contiguous block of rows. ``get_range`` returns that block as a view into the
+    loaded table, so handing out many report intervals does not copy any data.
+
+    :param stars: structured array (or StarTable) of guide star statistics
+    """
+
+    def __init__(self, stars):
+        if not isinstance(stars, StarTable):
+            stars = StarTable.from_stars(stars)
+        if not is_time_sorted(stars):
+            logger.debug("Sorting guide stars by kalman_tstart")
+            stars = stars[np.argsort(stars["kalman_tstart"], kind="stable")]
+        self.stars = stars
+
+    def __len__(self):
+        return len(self.stars)
+
+    @classmethod
+    def load(cls):
+        """
+        Read the mission guide star table from mica.
+
+        :rtype: GuideStatsTable
+        """
+        # mica is slow to import and not needed when nothing changed since the last run
+        import mica.stats.guide_stats  # noqa: PLC0415
+
+        t0 = time.perf_counter()
+        # the full table is only referenced until its columns are copied
+        table = cls(mica.stats.guide_stats.get_stats())
+        logger.info(
+            f"Loaded {len(table)} guide stars in {time.perf_counter() - t0:.2f} s "
+            f"({table.stars.nbytes / 2**20:.1f} MB)"
+        )
+        return table
+
+    def get_range(self, tstart, tstop):
+        """
+        Get the guide stars with tstart <= kalman_tstart < tstop.
+
+        :param tstart: range start (Chandra secs)
+        :param tstop: range stop (Chandra secs)
+        :rtype: view of the stars in the range
+        """
+        return time_slice(self.stars, tstart, tstop)
@@ -0,0 +1,69 @@
+"""
+Fixtures of the guide_stat_reports tests.
+"""
+
+import numpy as np
+import pytest
+from chandra_time import DateTime
+
+from guide_stat_reports.table import STAR_COLUMNS, GuideStatsTable
+
+TSTART = "2023:335:00:00:00.000"
+TSTOP = "2025:001:00:00:00.000"
+"""
+Time span of the synthetic guide star table (all the months of 2024 and December 2023)
+"""
+
+
+def make_stars(tstart=TSTART, tstop=TSTOP, stars_per_day=40, seed=0):
+    """
+    Make a synthetic guide star table.
+
+    About 1% of the stars have a partial track fraction and 0.2% are not tracked at
+    all, 8% have some OBC bad status, and 10% are from ER observations.
+
+    :param tstart: start of the table (any chandra_time DateTime format)
+    :param tstop: end of the table (any chandra_time DateTime format)
+    :param stars_per_day: average number of stars per day
+    :param seed: random seed
+    :returns: structured array with the STAR_COLUMNS, sorted by kalman_tstart
+    """
+    rng = np.random.default_rng(seed)
+    tstart = DateTime(tstart).secs
+    tstop = DateTime(tstop).secs
+    n_stars = int((tstop - tstart) / 86400 * stars_per_day)
+
+    stars = np.zeros(n_stars, dtype=list(STAR_COLUMNS.items()))
+    stars["kalman_tstart"] = np.sort(rng.uniform(tstart, tstop, n_stars))
+    er = rng.random(n_stars) < 0.1
+    stars["obsid"] = np.where(
+        er, rng.integers(38000, 65536, n_stars), rng.integers(0, 38000, n_stars)
+    )
+    stars["agasc_id"] = rng.integers(1, 2**31 - 1, n_stars)
+    stars["mag_aca"] = rng.triangular(5.5, 10.3, 10.9, n_stars)
+    stars["color"] = rng.uniform(-0.3, 1.8, n_stars)
+    stars["aoacmag_mean"] = stars["mag_aca"] + rng.normal(0, 0.2, n_stars)
+
+    f_track = np.ones(n_stars)
+    partial = rng.random(n_stars) < 0.01
+    f_track[partial] = rng.random(np.count_nonzero(partial))
+    f_track[rng.random(n_stars) < 0.002] = 0
+    stars["f_track"] = f_track
+
+    obc_bad = rng.random(n_stars) < 0.08
+    stars["f_obc_bad"][obc_bad] = rng.random(np.count_nonzero(obc_bad))
+    return stars
+
+
+@pytest.fixture(scope="session")
+def stars():
+    """Synthetic guide star table (read-only, tests change copies of it)."""
+    stars = make_stars()
+    stars.flags.writeable = False
+    return stars
+
+
+@pytest.fixture(scope="session")
+def table(stars):
+    """Synthetic mission guide star table."""
+    return GuideStatsTable(stars)
@@ -0,0 +1,145 @@
+import datetime
+
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.aggregates import (
+    add_flags,
+    get_aggregates,
+    get_fail_counts,
+    get_fail_masks,
+    get_flag_counts,
+    get_flags,
+    get_mag_bin_index,
+    get_mag_bins,
+    get_star_flags,
+    sum_monthly_aggregates,
+    write_aggregates,
+)
+from guide_stat_reports.gui_stat_reports import compute_interval_stats
+from guide_stat_reports.table import GuideStatsTable
+
+# report defaults, most stars are outside the magnitude bins
+BAD_THRESH = 0.05
+OBC_BAD_THRESH = 0.05
+MAG_BINS = get_mag_bins(10.0, 10.9, 0.1)
+CONFIG = {"bad_thresh": BAD_THRESH, "obc_bad_thresh": OBC_BAD_THRESH}
+
+MONTHS = [(2023, 12)] + [(2024, month) for month in range(1, 13)]
+"""
+Months of the synthetic guide star table
+"""
+
+
+def get_month(year, month):
+    """Get the start and stop (Chandra secs) of a month."""
+    start = datetime.date(year, month, 1)
+    stop = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return tuple(
+        DateTime(date.strftime("%Y:%j:00:00:00.000")).secs for date in (start, stop)
+    )
+
+
+def assert_counts_equal(counts, expected):
+    assert counts.keys() == expected.keys()
+    for key, value in expected.items():
+        assert np.array_equal(counts[key], value), key
+
+
+def write_monthly_aggregates(table, datadir):
+    for year, month in MONTHS:
+        tstart, tstop = get_month(year, month)
+        stars = table.get_range(tstart, tstop)
+        dataout = datadir / str(year) / f"M{month:02d}"
+        dataout.mkdir(parents=True)
+        counts = get_aggregates(stars, BAD_THRESH, OBC_BAD_THRESH, MAG_BINS)
+        write_aggregates(
+            dataout, counts, stars, tstart=tstart, tstop=tstop, config=CONFIG
+        )
+
+
+def test_sum_monthly_aggregates_reprocessed(stars, tmp_path):
+    """Monthly counts are not used once the values of their stars changed."""
+    write_monthly_aggregates(GuideStatsTable(stars), tmp_path)
+    tstart = get_month(2024, 4)[0]
+    tstop = get_month(2024, 6)[1]
+    table = GuideStatsTable(stars)
+    assert sum_monthly_aggregates(tmp_path, table, tstart, tstop, CONFIG) is not None
+
+    stars = stars.copy()
+    stars["f_obc_bad"][np.searchsorted(stars["kalman_tstart"], tstart)] += 0.5
+    table = GuideStatsTable(stars)
+    assert sum_monthly_aggregates(tmp_path, table, tstart, tstop, CONFIG) is None
+
+
+def test_sum_monthly_aggregates(table, tmp_path):
+    """The sums of the monthly counts are the counts of the stars of the interval."""
+    write_monthly_aggregates(table, tmp_path)
+    spans = [((2023, 12), (2024, 2)), ((2024, 1), (2024, 12))]
+    spans += [((2024, month), (2024, month + 2)) for month in range(1, 11)]
+    for first, last in spans:
+        tstart = get_month(*first)[0]
+        tstop = get_month(*last)[1]
+        counts = sum_monthly_aggregates(tmp_path, table, tstart, tstop, CONFIG)
+        stars = table.get_range(tstart, tstop)
+        assert_counts_equal(
+            counts, get_aggregates(stars, BAD_THRESH, OBC_BAD_THRESH, MAG_BINS)
+        )
+
+    # not the same options, or not covered by the months
+    tstart = get_month(2024, 1)[0]
+    tstop = get_month(2024, 3)[1]
+    other_config = {**CONFIG, "bad_thresh": 0.1}
+    assert sum_monthly_aggregates(tmp_path, table, tstart, tstop, other_config) is None
+    assert sum_monthly_aggregates(tmp_path, table, tstart + 1, tstop, CONFIG) is None
+    assert sum_monthly_aggregates(tmp_path, table, tstart, tstop + 1, CONFIG) is None
+
+
+def test_interval_report_from_months(table, tmp_path):
+    """A report from the summed monthly counts is the report from the stars."""
+    write_monthly_aggregates(table, tmp_path)
+    tstart = get_month(2024, 4)[0]
+    tstop = get_month(2024, 6)[1]
+    thresholds = {"bad_thresh": BAD_THRESH, "obc_bad_thresh": OBC_BAD_THRESH}
+    aggregates = sum_monthly_aggregates(tmp_path, table, tstart, tstop, CONFIG)
+    stats = compute_interval_stats(
+        table, tstart, tstop, thresholds, mag_bins=MAG_BINS, aggregates=aggregates
+    )
+    expected = compute_interval_stats(
+        table, tstart, tstop, thresholds, mag_bins=MAG_BINS
+    )
+    assert stats.rep == expected.rep
+
+
+def test_flag_counts(stars):
+    """The counts from the flags are the counts from the failure masks."""
+    stars = stars.copy()
+    stars["f_track"][::97] = np.nan
+    mag_idx = get_mag_bin_index(stars, MAG_BINS)
+    n_bins = len(MAG_BINS) - 1
+    for bad_thresh, obc_bad_thresh in [(BAD_THRESH, OBC_BAD_THRESH), (0.5, 0.01)]:
+        flags = get_flags(stars, bad_thresh, obc_bad_thresh)
+        fail_masks = get_fail_masks(stars, bad_thresh, obc_bad_thresh)
+        assert_counts_equal(
+            get_flag_counts(flags, mag_idx, n_bins),
+            get_fail_counts(stars, fail_masks, mag_idx, n_bins),
+        )
+
+    table = GuideStatsTable(stars)
+    tstart, tstop = get_month(2024, 6)
+    expected = {
+        thresh: get_aggregates(
+            table.get_range(tstart, tstop), thresh, OBC_BAD_THRESH, MAG_BINS
+        )
+        for thresh in [BAD_THRESH, 0.5]
+    }
+    add_flags(table, BAD_THRESH, OBC_BAD_THRESH)
+    range_stars = table.get_range(tstart, tstop)
+    assert get_star_flags(range_stars, BAD_THRESH, OBC_BAD_THRESH) is not None
+    # flags computed with other thresholds are not used
+    assert get_star_flags(range_stars, 0.5, OBC_BAD_THRESH) is None
+    for thresh in [BAD_THRESH, 0.5]:
+        assert_counts_equal(
+            get_aggregates(range_stars, thresh, OBC_BAD_THRESH, MAG_BINS),
+            expected[thresh],
+        )
@@ -0,0 +1,141 @@
+import numpy as np
+from chandra_time import DateTime
+
+from guide_stat_reports.aggregates import add_flags
+from guide_stat_reports.gui_stat_reports import (
+    EMPTY_STAR_LIST,
+    get_parser,
+    get_run_state,
+    is_unchanged,
+    update_reports,
+    write_if_changed,
+    write_run_state,
+    write_star_lists,
+)
+from guide_stat_reports.summary_store import SUMMARY_FILE, read_summary
+from guide_stat_reports.table import GuideStatsTable
+from guide_stat_reports.timings import Timings
+
+TRANGE = {
+    "year": 2024,
+    "subid": "M06",
+    "start": "2024:153:00:00:00.000",
+    "stop": "2024:183:00:00:00.000",
+}
+"""
+Report interval of the tests
+"""
+
+
+def get_opt(tmp_path, *args):
+    return get_parser().parse_args(
+        ["--webdir", str(tmp_path / "web"), "--datadir", str(tmp_path / "data"), *args]
+    )
+
+
+def get_table(stars):
+    table = GuideStatsTable(stars)
+    add_flags(table, 0.05, 0.05)
+    return table
+
+
+def update(table, opt):
+    updated, _ = update_reports(
+        table, {"2024-M06": TRANGE}, opt, Timings(enabled=False)
+    )
+    return list(updated)
+
+
+def test_update_reports_manifest(stars, tmp_path):
+    """A report is only regenerated if its stars or options changed, or with --force."""
+    opt = get_opt(tmp_path)
+    assert update(get_table(stars), opt) == ["2024-M06"]
+    assert (tmp_path / "data" / "2024" / "M06" / "manifest.json").exists()
+    assert update(get_table(stars), opt) == []
+    assert update(get_table(stars), get_opt(tmp_path, "--force")) == ["2024-M06"]
+
+    # reprocessed values, with the same stars and times
+    stars = stars.copy()
+    idx = np.searchsorted(stars["kalman_tstart"], DateTime(TRANGE["start"]).secs)
+    stars["f_track"][idx] = 0.5 if stars["f_track"][idx] == 1 else 1
+    assert update(get_table(stars), opt) == ["2024-M06"]
+    assert update(get_table(stars), opt) == []
+
+    opt = get_opt(tmp_path, "--bad_thresh", "0.1")
+    assert update(get_table(stars), opt) == ["2024-M06"]
+
+
+def test_update_reports_summary(stars, tmp_path):
+    """The summary store has a row for each written report, even if it was removed."""
+    opt = get_opt(tmp_path)
+    table = get_table(stars)
+    updated, summary = update_reports(
+        table, {"2024-M06": TRANGE}, opt, Timings(enabled=False)
+    )
+    assert list(summary["tname"]) == ["2024-M06"]
+    assert summary["n_stars"][0] == updated["2024-M06"]["n_stars"]
+
+    (opt.datadir / SUMMARY_FILE).unlink()
+    assert update(table, opt) == []
+    assert np.array_equal(read_summary(opt.datadir), summary)
+
+
+def test_is_unchanged(tmp_path):
+    """A run is a no-op only if the table, intervals and options are unchanged."""
+    source_file = tmp_path / "guide_stats.h5"
+    source_file.write_bytes(b"stars")
+    to_update = {"2024-M06": TRANGE}
+    opt = get_opt(tmp_path)
+    assert not is_unchanged(opt, to_update)
+
+    write_run_state(opt.datadir, get_run_state(opt, to_update, source_file))
+    assert is_unchanged(opt, to_update)
+    assert not is_unchanged(get_opt(tmp_path, "--force"), to_update)
+    assert not is_unchanged(get_opt(tmp_path, "--bad_thresh", "0.1"), to_update)
+    assert not is_unchanged(opt, {**to_update, "2024-Q3": TRANGE})
+    other_file = tmp_path / "other.h5"
+    other_file.write_bytes(b"other stars")
+    assert not is_unchanged(opt, to_update, other_file)
+    assert is_unchanged(opt, to_update, source_file)
+
+    source_file.write_bytes(b"more stars")
+    assert not is_unchanged(opt, to_update)
+    source_file.unlink()
+    assert not is_unchanged(opt, to_update)
+
+
+def test_write_if_changed(tmp_path):
+    """A file is only written if its content changed."""
+    path = tmp_path / "page.html"
+    assert write_if_changed(path, "stars")
+    mtime = path.stat().st_mtime_ns
+    assert not write_if_changed(path, "stars")
+    assert path.stat().st_mtime_ns == mtime
+    assert write_if_changed(path, "other stars")
+    assert path.read_text() == "other stars"
+
+
+def test_write_star_lists(stars, tmp_path):
+    """Empty lists share one page, and only changed pages are rewritten."""
+    star_lists = {
+        "bad_trak_stars_list.html": stars[:3],
+        "bad_trak_10.0_stars_list.html": stars[:2],
+        "bad_trak_10.1_stars_list.html": stars[:0],
+        "no_trak_stars_list.html": stars[:0],
+    }
+    assert write_star_lists(star_lists, tmp_path) == 3
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [
+            "bad_trak_stars_list.html",
+            "bad_trak_10.0_stars_list.html",
+            EMPTY_STAR_LIST,
+        ]
+    )
+    page = (tmp_path / "bad_trak_stars_list.html").read_text()
+    assert str(stars["agasc_id"][2]) in page
+    assert write_star_lists(star_lists, tmp_path) == 0
+
+    # a bin whose failures were reprocessed away gets the shared empty page
+    star_lists["bad_trak_10.0_stars_list.html"] = stars[:0]
+    assert write_star_lists(star_lists, tmp_path) == 0
+    assert not (tmp_path / "bad_trak_10.0_stars_list.html").exists()
@@ -0,0 +1,45 @@
+from guide_stat_reports.pipeline import run_pipeline
+from guide_stat_reports.tests.test_gui_stat_reports import TRANGE, get_opt, get_table
+from guide_stat_reports.timings import Timings
+
+
+def run(table, opt):
+    """Run the pipeline on one interval and the table in memory, as --watch does."""
+    timings = Timings()
+    results = run_pipeline(
+        opt,
+        timings,
+        {
+            "ranges": {"to_update": {"2024-M06": TRANGE}, "source_file": None},
+            "table": {"table": table, "run_state": None},
+        },
+    )
+    written = [name for name in ["toc", "summary"] if results[name]["written"]]
+    return list(results["reports"]["updated"]), written, set(timings.stages)
+
+
+def test_pipeline_skips_pages(stars, tmp_path):
+    """The table of contents and summary are only rewritten if a report changed."""
+    table = get_table(stars)
+    opt = get_opt(tmp_path)
+    updated, written, stages = run(table, opt)
+    assert updated == ["2024-M06"]
+    assert written == ["toc", "summary"]
+    assert {"ranges", "toc", "gui_summarize"} & stages == {"toc", "gui_summarize"}
+    index = tmp_path / "web" / "index.html"
+    summary = tmp_path / "web" / "summary" / "guide_summary.html"
+    assert index.exists() and summary.exists()
+
+    updated, written, stages = run(table, opt)
+    assert (updated, written) == ([], [])
+    assert {"toc", "gui_summarize"} & stages == set()
+
+    # missing pages are written even if no report changed
+    index.unlink()
+    assert run(table, opt)[:2] == ([], ["toc"])
+    assert index.exists()
+
+    assert run(table, get_opt(tmp_path, "--force"))[:2] == (
+        ["2024-M06"],
+        ["toc", "summary"],
+    )
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from guide_stat_reports import snapshot
+from guide_stat_reports.snapshot import (
+    SNAPSHOT_DIR,
+    SNAPSHOT_META,
+    is_current,
+    load_table,
+    read_snapshot,
+    refresh_snapshot,
+    verify_snapshot,
+)
+from guide_stat_reports.table import GuideStatsTable
+
+
+@pytest.fixture
+def loads(stars, monkeypatch):
+    """Load the synthetic stars instead of the mica table, counting the loads."""
+    loads = []
+
+    def load():
+        loads.append(1)
+        return GuideStatsTable(stars)
+
+    monkeypatch.setattr(GuideStatsTable, "load", load)
+    return loads
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    """Stand-in for the mica guide star table file (only its stat is used)."""
+    source_file = tmp_path / "gui_stats.h5"
+    source_file.write_bytes(b"stars")
+    return source_file
+
+
+def get_versions(snapdir):
+    return sorted(path.name for path in snapdir.parent.glob(f"{SNAPSHOT_DIR}-*"))
+
+
+def assert_stars_equal(table, stars):
+    for name in stars.dtype.names:
+        assert np.array_equal(table[name], stars[name]), name
+
+
+def test_refresh_snapshot(stars, loads, source_file, tmp_path):
+    """The snapshot is only rebuilt when the source changes, in a new directory."""
+    snapdir = tmp_path / "data" / SNAPSHOT_DIR
+    assert refresh_snapshot(snapdir, source_file)
+    assert not refresh_snapshot(snapdir, source_file)
+    assert len(loads) == 1
+    assert snapdir.is_symlink()
+    (version,) = get_versions(snapdir)
+    assert snapdir.resolve().name == version
+    assert verify_snapshot(snapdir, source_file) == []
+    old = read_snapshot(snapdir)
+
+    source_file.write_bytes(b"more stars")
+    assert verify_snapshot(snapdir, source_file) == [
+        f"snapshot is out of date with {source_file}"
+    ]
+    assert refresh_snapshot(snapdir, source_file)
+    assert len(loads) == 2
+    (new_version,) = get_versions(snapdir)
+    assert new_version != version
+    assert snapdir.resolve().name == new_version
+    assert_stars_equal(read_snapshot(snapdir), stars)
+    # readers of the replaced snapshot keep their mapped columns
+    assert_stars_equal(old, stars)
+
+    assert refresh_snapshot(snapdir, source_file, force=True)
+    assert len(loads) == 3
+    assert len(get_versions(snapdir)) == 1
+
+
+@pytest.mark.parametrize("damage", ["truncate", "delete", "meta"])
+def test_refresh_corrupted_snapshot(damage, stars, loads, source_file, tmp_path):
+    """A snapshot with a missing or truncated file is rebuilt."""
+    snapdir = tmp_path / "data" / SNAPSHOT_DIR
+    refresh_snapshot(snapdir, source_file)
+    path = snapdir / ("f_track.npy" if damage != "meta" else SNAPSHOT_META)
+    if damage == "truncate":
+        path.write_bytes(path.read_bytes()[:-8])
+    else:
+        path.unlink()
+
+    assert verify_snapshot(snapdir, source_file)
+    assert not is_current(snapdir, snapshot.get_source_info(source_file))
+    assert refresh_snapshot(snapdir, source_file)
+    assert len(loads) == 2
+    assert verify_snapshot(snapdir, source_file) == []
+    assert_stars_equal(read_snapshot(snapdir), stars)
+
+
+def test_load_table(stars, loads, source_file, tmp_path, monkeypatch):
+    """The table is mapped from the snapshot, or loaded from mica if it can't be."""
+    snapdir = tmp_path / "data" / SNAPSHOT_DIR
+    table = load_table(snapdir, source_file)
+    assert isinstance(table.stars["f_track"], np.memmap)
+    assert_stars_equal(table.stars, stars)
+    assert len(load_table(snapdir, source_file)) == len(stars)
+    assert len(loads) == 1
+
+    monkeypatch.setattr(snapshot, "read_snapshot", lambda snapdir: None)
+    assert_stars_equal(load_table(snapdir, source_file).stars, stars)
+    assert len(loads) == 2
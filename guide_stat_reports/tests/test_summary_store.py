@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+from guide_stat_reports.aggregates import FAIL_TYPES
+from guide_stat_reports.summary_store import (
+    get_cadence,
+    read_summary,
+    rebuild_summary,
+    upsert_summary,
+)
+
+INTERVALS = {
+    ("2024", "M01"): ("2024-M01", "2024:001:00:00:00.000", "2024:032:00:00:00.000"),
+    ("2024", "M02"): ("2024-M02", "2024:032:00:00:00.000", "2024:061:00:00:00.000"),
+    ("2024", "M03"): ("2024-M03", "2024:061:00:00:00.000", "2024:092:00:00:00.000"),
+    ("2024", "Q1"): ("2024-Q1", "2024:001:00:00:00.000", "2024:092:00:00:00.000"),
+}
+"""
+(year, subid) to name, start and stop of the report intervals of the tests
+"""
+
+
+def make_rep(key, n_stars):
+    """Make the summary values of a report, as written to rep.json."""
+    tname, datestart, datestop = INTERVALS[key]
+    rng = np.random.default_rng(n_stars)
+    fail_types = []
+    for ftype in FAIL_TYPES:
+        rate = rng.random() / 10
+        fail_types.append(
+            {
+                "type": ftype,
+                "n_stars": int(rate * n_stars),
+                "rate": rate,
+                "rate_err_high": rate + 0.01,
+                "rate_err_low": rate - 0.01,
+                "n_stars_pred": rate * n_stars * 1.1,
+                "rate_pred": rate * 1.1,
+                "p_less": rng.random(),
+                "p_more": rng.random(),
+            }
+        )
+    return {
+        "datestring": tname,
+        "datestart": datestart,
+        "datestop": datestop,
+        "n_stars": n_stars,
+        "fail_types": fail_types,
+    }
+
+
+def write_reps(datadir, reps):
+    for (year, subid), rep in reps.items():
+        path = datadir / year / subid / "rep.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(rep))
+
+
+def test_upsert_rebuild(tmp_path):
+    """Upserting the reports as they are written gives the store rebuilt from them."""
+    reps = {key: make_rep(key, 1000 + i) for i, key in enumerate(INTERVALS)}
+    keys = list(reps)
+
+    # the store is built from the existing reports on the first upsert
+    write_reps(tmp_path, {key: reps[key] for key in keys[:2]})
+    summary = upsert_summary(tmp_path, {keys[2]: reps[keys[2]]})
+    assert sorted(summary["tname"]) == ["2024-M01", "2024-M02", "2024-M03"]
+
+    # later upserts replace the rows of reprocessed intervals
+    write_reps(tmp_path, {key: reps[key] for key in keys[2:]})
+    upsert_summary(tmp_path, {keys[3]: reps[keys[3]]})
+    reps[keys[0]] = make_rep(keys[0], 2000)
+    write_reps(tmp_path, {keys[0]: reps[keys[0]]})
+    summary = upsert_summary(tmp_path, {keys[0]: reps[keys[0]]})
+
+    summary = np.sort(summary, order="tname")
+    assert np.array_equal(np.sort(read_summary(tmp_path), order="tname"), summary)
+    assert len(summary) == len(reps)
+    row = summary[summary["tname"] == "2024-M01"][0]
+    assert row["n_stars"] == 2000
+    assert row["obc_bad_rate"] == reps[keys[0]]["fail_types"][2]["rate"]
+
+    assert np.array_equal(np.sort(rebuild_summary(tmp_path), order="tname"), summary)
+
+    months = get_cadence(summary, "month")
+    assert list(months["tname"]) == ["2024-M01", "2024-M02", "2024-M03"]
+    assert np.all(np.diff(months["tstart"]) > 0)
+    assert list(get_cadence(summary, "quarter")["tname"]) == ["2024-Q1"]
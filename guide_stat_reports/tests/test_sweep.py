@@ -0,0 +1,21 @@
+import numpy as np
+
+from guide_stat_reports.aggregates import get_aggregates, get_mag_bins
+from guide_stat_reports.sweep import sweep_thresholds
+
+MAG_BINS = get_mag_bins(10.0, 10.9, 0.1)
+
+
+def test_sweep_one_threshold(table):
+    """A sweep at one pair of thresholds gives the counts of the reports."""
+    stars = table.stars
+    for bad_thresh, obc_bad_thresh in [(0.05, 0.05), (0.0, 0.5)]:
+        sweep = sweep_thresholds(
+            stars, {"bad_trak": [bad_thresh], "obc_bad": [obc_bad_thresh]}, MAG_BINS
+        )
+        counts = get_aggregates(stars, bad_thresh, obc_bad_thresh, MAG_BINS)
+        assert np.array_equal(sweep["n_stars"][0], counts["mag_n_stars"])
+        for ftype in ["bad_trak", "obc_bad"]:
+            assert np.array_equal(
+                sweep[f"{ftype}_n_stars"][0, :, 0], counts[f"{ftype}_mag_n_stars"]
+            )
@@ -0,0 +1,40 @@
+import tracemalloc
+
+import numpy as np
+
+from guide_stat_reports.timings import Timings
+
+
+def test_disabled():
+    """Disabled timings record nothing and accept the rows and files."""
+    timings = Timings(enabled=False)
+    with timings.stage("load") as stage:
+        stage.rows = 10
+    assert timings.as_dict() == {}
+
+
+def test_stages():
+    """Each stage has its own traced peak, included in those of enclosing stages."""
+    tracemalloc.start()
+    try:
+        timings = Timings()
+        with timings.stage("run"):
+            with timings.stage("load", files=1) as stage:
+                stars = np.ones(2_000_000)
+                stage.rows = len(stars)
+            del stars
+            with timings.stage("write"):
+                pass
+    finally:
+        tracemalloc.stop()
+
+    stages = timings.as_dict()
+    assert list(stages) == ["load", "write", "run"]
+    assert stages["load"]["rows"] == 2_000_000
+    assert stages["load"]["files"] == 1
+    assert stages["load"]["traced_peak_mb"] > 15
+    assert stages["write"]["traced_peak_mb"] < 1
+    assert stages["run"]["traced_peak_mb"] >= stages["load"]["traced_peak_mb"]
+    for values in stages.values():
+        assert values["maxrss_increase_mb"] >= 0
+        assert values["maxrss_mb"] >= values["maxrss_increase_mb"]
@@ -0,0 +1,160 @@
+"""
+Per-stage timing and memory instrumentation.
+
+Stages are timed with ``Timings.stage``, a context manager that records the wall time,
+CPU time and memory of the stage, together with the number of rows processed and files
+written when the caller sets them. Each stage is logged as a structured (JSON) log line.
+When the instrumentation is disabled, ``stage`` returns a shared no-op context manager.
+
+The peak resident memory (maxrss) of a process only ever grows, so for each stage both
+the maxrss at its end and its increase during the stage are recorded. When tracemalloc
+is tracing (e.g. with ``PYTHONTRACEMALLOC=1``), the peak of the memory allocated by
+Python during the stage is recorded too.
+"""
+
+import contextlib
+import json
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+
+logger = logging.getLogger("acq_stat_reports")
+
+TIMINGS_FILE = "timings.json"
+"""
+Name of the run-level timings file in the data directory
+"""
+
+
+def get_maxrss():
+    """
+    Get the peak resident memory of this process in MB.
+
+    :rtype: float
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
+
+
+# Traced peak so far of each open stage, innermost last. tracemalloc has a single peak,
+# which is reset at the start of each stage, so the peak of a stage is passed on to the
+# stage that encloses it when it ends.
+_traced_peaks = []
+
+
+def _start_traced_peak():
+    if _traced_peaks:
+        _traced_peaks[-1] = max(_traced_peaks[-1], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    _traced_peaks.append(0)
+
+
+def _stop_traced_peak():
+    peak = max(_traced_peaks.pop(), tracemalloc.get_traced_memory()[1])
+    if _traced_peaks:
+        _traced_peaks[-1] = max(_traced_peaks[-1], peak)
+    return peak / 2**20
+
+
+class Stage:
+    """
+    Measurements of one stage.
+
+    ``rows`` and ``files`` can be set by the caller inside the ``Timings.stage`` block.
+    """
+
+    def __init__(self, name, rows=None, files=None):
+        self.name = name
+        self.rows = rows
+        self.files = files
+        self.wall = None
+        self.cpu = None
+        self.maxrss = None
+        self.maxrss_increase = None
+        self.traced_peak = None
+
+    def as_dict(self):
+        return {
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "maxrss_mb": self.maxrss,
+            "maxrss_increase_mb": self.maxrss_increase,
+            "traced_peak_mb": self.traced_peak,
+            "rows": self.rows,
+            "files": self.files,
+        }
+
+
+class _NullStage:
+    # accepts and discards the rows and files set when timings are disabled
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = contextlib.nullcontext(_NullStage())
+
+
+class Timings:
+    """
+    Timings of the stages of a run or of a report interval.
+
+    :param context: dict of values included in each log line (e.g. the interval name)
+    :param enabled: if False, nothing is measured or logged
+    """
+
+    def __init__(self, context=None, *, enabled=True):
+        self.context = context or {}
+        self.enabled = enabled
+        self.stages = {}
+
+    def stage(self, name, rows=None, files=None):
+        """
+        Time a stage.
+
+        :param name: stage name
+        :param rows: number of rows processed (can also be set on the returned Stage)
+        :param files: number of files written (can also be set on the returned Stage)
+        :returns: context manager yielding the Stage
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._stage(name, rows, files)
+
+    @contextlib.contextmanager
+    def _stage(self, name, rows, files):
+        stage = Stage(name, rows, files)
+        # checked once, so that starting tracemalloc in a stage does not unbalance
+        # the traced peaks
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            _start_traced_peak()
+        maxrss0 = get_maxrss()
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield stage
+        finally:
+            stage.cpu = time.process_time() - cpu0
+            stage.wall = time.perf_counter() - wall0
+            stage.maxrss = get_maxrss()
+            stage.maxrss_increase = stage.maxrss - maxrss0
+            if tracing:
+                stage.traced_peak = _stop_traced_peak()
+            self.stages[name] = stage
+            logger.info(
+                "timing "
+                + json.dumps({**self.context, "stage": name, **stage.as_dict()})
+            )
+
+    def as_dict(self):
+        """
+        Get the measurements of all stages.
+
+        :rtype: dict of stage name to dict of measurements
+        """
+        return {name: stage.as_dict() for name, stage in self.stages.items()}
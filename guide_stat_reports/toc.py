@@ -7,6 +7,8 @@ from pathlib import Path
 
 import jinja2
 
+from guide_stat_reports.summary_store import read_summary
+
 JINJA_ENV = jinja2.Environment(
     loader=jinja2.FileSystemLoader(Path(__file__).parent / "templates" / "guide_stats")
 )
@@ -77,8 +79,24 @@ def get_cells(year, interval):
         return [{"year": year, "start": start, "span": span}]
 
 
-def get_toc(data_dir):
-    all_years = [int(p.name) for p in sorted(data_dir.glob("????"))]
+def get_toc(data_dir, intervals=None):
+    """
+    Get the cells of the table of contents.
+
+    :param data_dir: directory with one <year>/<subid> directory per report interval
+    :param intervals: list of (year, subid) of the report intervals. By default these
+        are found by listing data_dir.
+    """
+    if intervals is None:
+        # these are the actual data directories
+        directories = (
+            sorted(data_dir.glob("*/M??"))
+            + sorted(data_dir.glob("*/Q?"))
+            + sorted(data_dir.glob("*/S?"))
+            + sorted(data_dir.glob("*/YEAR"))
+        )
+        intervals = [(path.parent.name, path.name) for path in directories]
+    all_years = sorted({int(year) for year, _ in intervals})
     all_semi = [f"S{semi:01d}" for semi in range(1, 3)]
     all_quarters = [f"Q{quarter:01d}" for quarter in range(1, 5)]
     all_months = [f"M{month:02d}" for month in range(1, 13)]
@@ -89,16 +107,9 @@ def get_toc(data_dir):
         for interval in all_months + all_quarters + all_semi + ["YEAR"]
     }
 
-    # these are the actual data directories
-    directories = (
-        sorted(data_dir.glob("*/M??"))
-        + sorted(data_dir.glob("*/Q?"))
-        + sorted(data_dir.glob("*/S?"))
-        + sorted(data_dir.glob("*/YEAR"))
-    )
-    for path in directories:
-        for cell in all_cells[(int(path.parent.name), path.name)]:
-            cell["path"] = path.relative_to(data_dir)
+    for year, subid in intervals:
+        for cell in all_cells[(int(year), subid)]:
+            cell["path"] = Path(str(year)) / subid
 
     # and these are the table cells (one interval can be split into two cells)
     values = [
@@ -138,13 +149,34 @@ def get_parser():
         help="Output directory",
         type=Path,
     )
+    parser.add_argument(
+        "--datadir",
+        help="Data directory. If given and it has a summary store, the report "
+        "intervals are taken from the store instead of listing the output directory.",
+        type=Path,
+    )
     return parser
 
 
-def main():
-    args = get_parser().parse_args()
+def get_summary_intervals(summary):
+    """
+    Get the report intervals in the summary store.
+
+    :param summary: summary store array (from read_summary)
+    :returns: list of (year, subid)
+    """
+    return list(zip(summary["year"], summary["subid"], strict=True))
 
-    values = get_toc(data_dir=args.webdir)
+
+def make_toc(webdir, intervals=None):
+    """
+    Write the table of contents page.
+
+    :param webdir: output web directory, with one <year>/<subid> directory per report
+    :param intervals: list of (year, subid) of the report intervals. By default these
+        are found by listing webdir.
+    """
+    values = get_toc(data_dir=webdir, intervals=intervals)
     all_years = sorted({val[0] for val in values})
     semi_data = [
         [
@@ -186,9 +218,20 @@ def main():
         semi_data=semi_data,
         yearly_data=yearly_data,
     )
-    with open(args.webdir / "index.html", "w") as fh:
+    with open(webdir / "index.html", "w") as fh:
         fh.write(text)
 
 
+def main():
+    args = get_parser().parse_args()
+
+    intervals = None
+    if args.datadir is not None:
+        summary = read_summary(args.datadir)
+        if summary is not None:
+            intervals = get_summary_intervals(summary)
+    make_toc(args.webdir, intervals)
+
+
 if __name__ == "__main__":
     main()